@@ -2,7 +2,15 @@
 # MODIFIED 6/20/2024: COMMENTED OUT LEFTOVER DEBUG STATEMENT AND ADDED NOTICE OF ORIGINAL AUTHOR
 #! /usr/bin/env python3
 
+import io
+import sys
 from helpers import Input_stream, Dictionary, LzssConfig, array_to_hexstring
+from profiles import CMPS_PROFILE, MIN_HEADER_SIZE, MAX_HEADER_SIZE, container_profile
+
+try:
+    import lzss_accel
+except ImportError:
+    lzss_accel = None
 
 DEBUG_DECODE = False
 
@@ -25,7 +33,6 @@ def get_offset_and_length(input_stream, lzss_config):
     byte1, byte2 = input_stream.get_2_bytes()
 
     if byte1 is None or byte2 is None:
-        #print(f"[DEBUG] Failed to fetch dict pointer at {input_stream.pos}")
         return None, None
 
     if DEBUG_DECODE:
@@ -58,13 +65,11 @@ def get_offset_and_length(input_stream, lzss_config):
 
     offset |= byte1
 
-    # print(" !!! DEBUG !!!   length_mask = ",  length_mask)
-    # print(" !!! DEBUG !!!   Length = ",  length)
-
     return offset, length
 
 
-def lzss_decode(lzss_config, compressed_data):
+def lzss_decode_reference(lzss_config, compressed_data, uncompressed_size=0):
+    # Original decoder working through Input_stream and Dictionary one operation at a time
     dictionary = Dictionary(lzss_config.dictionary_size, lzss_config.dictionary_start_position)
 
     input_stream = Input_stream(compressed_data)
@@ -74,8 +79,6 @@ def lzss_decode(lzss_config, compressed_data):
 
         flags_byte = input_stream.get_byte()
 
-        # dictionary.print_content()
-
         if DEBUG_DECODE:
             print(f"[DEBUG] [{input_stream.pos-1}] Getting flags: {flags_byte:02X} ({(flags_byte >> 4):04b} {flags_byte & 0x0F:04b})")
 
@@ -87,32 +90,21 @@ def lzss_decode(lzss_config, compressed_data):
 
                 offset, length = get_offset_and_length(input_stream, lzss_config)
 
-                if input_stream.pos-2 == 7:
-                    dictionary.print_content()
-
                 if DEBUG_DECODE:
                     print(f"[DEBUG] [{input_stream.pos-2}] [{len(decompressed_data)}] Putting matched string, offset: {offset}, len: {length}, symbols:", end='')
 
                 if offset is None or length is None:
                     break
 
-                if offset == 958:
-                    # breakpoint()
-                    pass
-
-                for j in range(length):
-                    if lzss_config.relative_offset:
-                        index = dictionary.pos - offset - 1
-                    else:
-                        index = offset + j
-                    literal = dictionary.get_byte(index)
-                    decompressed_data.append(literal)
-                    dictionary.add_byte(literal)
-                    if DEBUG_DECODE:
-                        print(f" {literal:02X}", end='')
+                if lzss_config.relative_offset:
+                    index = dictionary.pos - offset - 1
+                else:
+                    index = offset
+                match = dictionary.copy_from(index, length)
+                decompressed_data += match
 
                 if DEBUG_DECODE:
-                    print("")
+                    print(" " + array_to_hexstring(match))
             else:
                 # Next input byte is literal
                 literal = input_stream.get_byte()
@@ -127,26 +119,474 @@ def lzss_decode(lzss_config, compressed_data):
 
 
     if DEBUG_DECODE:
-        print("Dictionary content: " + array_to_hexstring(dictionary.data))
+        print("Dictionary content: " + array_to_hexstring(dictionary.window_view(0, dictionary.size)))
 
     return bytes(decompressed_data)
 
 
+def lzss_config_key(lzss_config):
+    # Everything that changes how a stream is decoded, LzssConfig attributes are often set after construction
+    return (
+        lzss_config.dictionary_size,
+        lzss_config.dictionary_start_position,
+        lzss_config.first_flag_is_lsb,
+        lzss_config.flag_set_is_pointer,
+        lzss_config.min_match_size,
+        lzss_config.offset_bit_size,
+        lzss_config.length_bit_size,
+        lzss_config.relative_offset,
+    )
+
+
+MAX_GROUP_SIZE = 1 + 8 * 2  # A flags byte followed by 8 pointers
+
+
+def compile_decoder(lzss_config):
+    # Build a decode function specialised for lzss_config
+    #
+    # All the per pointer work of get_offset_and_length() (sanity checks, masks, shifts) and the per bit work of
+    # flag_is_pointer() is done once here. The decoded output itself is used as the dictionary: it is preceded by one
+    # dictionary worth of (zeroed) initial content, so the dictionary ring is always the last dictionary_size bytes of it
+    # and pointers become slice copies.
+    #
+    # The returned decode_groups(data, pos, final, output, output_shift, output_limit) decodes the flag groups of data
+    # starting at pos into output and returns the position it stopped at. It stops before a group that may not be complete
+    # unless final is set, and once output holds output_limit bytes. output[i] is byte i + output_shift of the history
+    # (initial dictionary followed by the decoded data), which lets callers drop what is no longer needed from its front.
+    if lzss_config.offset_bit_size < 8 or lzss_config.offset_bit_size > 15 or\
+            lzss_config.length_bit_size < 1 or lzss_config.length_bit_size > 8:
+        print(f"[ERROR] Unsupported configuration of offset_bit_size or length_bit_size")
+        print(f"[ERROR] offset_bit_size = {lzss_config.offset_bit_size}, length_bit_size = {lzss_config.length_bit_size}")
+        exit(-1)
+
+    dictionary_size = lzss_config.dictionary_size
+    if dictionary_size & (dictionary_size - 1):
+        raise ValueError(f"dictionary_size must be a power of two, got {dictionary_size}")
+
+    dictionary_mask = dictionary_size - 1
+    dictionary_start = lzss_config.dictionary_start_position & dictionary_mask
+    min_match_size = lzss_config.min_match_size
+    relative_offset = lzss_config.relative_offset
+    length_mask = (1 << lzss_config.length_bit_size) - 1
+    offset_byte2_mask = (0xFF - length_mask) if lzss_config.offset_bit_size > 8 else 0
+    offset_byte2_shift = lzss_config.offset_bit_size - 8
+
+    # For every possible flags byte, whether each of its 8 operations is a pointer
+    flag_table = [tuple(bool(flag_is_pointer(flags_byte, flag_index, lzss_config)) for flag_index in range(8))
+                  for flags_byte in range(256)]
+    all_literals = [not any(flags) for flags in flag_table]
+
+    def decode_groups(data, pos, final, output, output_shift, output_limit):
+        data_size = len(data)
+        # Without final, only groups that are certainly complete are decoded
+        data_end = data_size if final else data_size - MAX_GROUP_SIZE + 1
+
+        while pos < data_end and len(output) < output_limit:
+            flags_byte = data[pos]
+            pos += 1
+
+            if all_literals[flags_byte] and pos + 8 <= data_size:
+                output += data[pos:pos + 8]
+                pos += 8
+                continue
+
+            for is_pointer in flag_table[flags_byte]:
+                if is_pointer:
+                    if pos + 2 > data_size:
+                        pos = data_size
+                        break
+                    byte1 = data[pos]
+                    byte2 = data[pos + 1]
+                    pos += 2
+
+                    length = (byte2 & length_mask) + min_match_size
+                    offset = ((byte2 & offset_byte2_mask) << offset_byte2_shift) | byte1
+
+                    write_pos = len(output)
+                    if relative_offset:
+                        source = write_pos - offset - 1
+                    else:
+                        # Newest history byte that went to dictionary address "offset"
+                        # History byte i went to address (dictionary_start + i - dictionary_size) & dictionary_mask
+                        decoded = write_pos + output_shift - dictionary_size
+                        source = write_pos - dictionary_size + ((offset - dictionary_start - decoded) & dictionary_mask)
+
+                    distance = write_pos - source
+                    if distance >= length:
+                        output += output[source:source + length]
+                    else:
+                        # The copy reads bytes it writes itself, which repeats the last "distance" bytes
+                        pattern = output[source:write_pos]
+                        output += (pattern * (length // distance + 1))[:length]
+                else:
+                    if pos >= data_size:
+                        break
+                    output.append(data[pos])
+                    pos += 1
+
+        return pos
+
+    return decode_groups
+
+
+compiled_decoders = {}
+
+
+def get_compiled_decoder(lzss_config):
+    key = lzss_config_key(lzss_config)
+    decode_groups = compiled_decoders.get(key)
+    if decode_groups is None:
+        decode_groups = compile_decoder(lzss_config)
+        compiled_decoders[key] = decode_groups
+    return decode_groups
+
+
+def as_byte_view(data):
+    view = memoryview(data)
+    if view.itemsize != 1 or view.format != "B":
+        view = view.cast("B")
+    return view
+
+
+def buffer_view(source):
+    # Byte view of source if it supports the buffer protocol (bytes, bytearray, mmap, memoryview, ...), None for a stream
+    try:
+        return as_byte_view(source)
+    except TypeError:
+        return None
+
+
+def lzss_decode_fast(lzss_config, compressed_data, uncompressed_size=0):
+    decode_groups = get_compiled_decoder(lzss_config)
+    output = bytearray(lzss_config.dictionary_size)
+    decode_groups(as_byte_view(compressed_data), 0, True, output, 0, sys.maxsize)
+    del output[:lzss_config.dictionary_size]
+    return bytes(output)
+
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+def iter_decode(source, lzss_config, chunk_size=DEFAULT_CHUNK_SIZE, checkpoints=None):
+    # Decode compressed data, yielding blocks of about chunk_size decompressed bytes
+    # source is a file-like object read chunk_size bytes at a time, or a buffer such as an mmap decoded in place
+    # Only the dictionary, one block of output and one chunk of input are kept in memory
+    # Every block ends on a flag group, if checkpoints is a list a Checkpoint is appended to it at the end of each block
+    decode_groups = get_compiled_decoder(lzss_config)
+    dictionary_size = lzss_config.dictionary_size
+
+    output = bytearray(dictionary_size)
+    output_shift = 0
+    data_offset = 0  # Position of data[0] in the compressed stream
+    pos = 0
+    data = buffer_view(source)
+    final = data is not None
+    if not final:
+        data = b""
+
+    while True:
+        if not final and len(data) - pos < MAX_GROUP_SIZE:
+            more = source.read(chunk_size)
+            if not more:
+                final = True
+            data = data[pos:] + more
+            data_offset += pos
+            pos = 0
+
+        pos = decode_groups(data, pos, final, output, output_shift, dictionary_size + chunk_size)
+
+        produced = len(output) - dictionary_size
+        if produced > 0:
+            if checkpoints is not None:
+                checkpoints.append(Checkpoint(data_offset + pos, output_shift + produced, bytes(output[produced:])))
+            yield bytes(output[dictionary_size:])
+            output_shift += produced
+            del output[:produced]
+        elif final:
+            break
+
+
+class Checkpoint:
+    # State of the decoder at the start of a flag group: where the group is in the compressed stream, how many bytes
+    # were decoded before it and the dictionary_size bytes decoded last (the initial dictionary at the very start)
+    __slots__ = ("compressed_pos", "decompressed_pos", "dictionary")
+
+    def __init__(self, compressed_pos, decompressed_pos, dictionary):
+        self.compressed_pos = compressed_pos
+        self.decompressed_pos = decompressed_pos
+        self.dictionary = dictionary
+
+
+def initial_checkpoint(lzss_config):
+    return Checkpoint(0, 0, bytes(lzss_config.dictionary_size))
+
+
+def decode_from_checkpoint(lzss_config, compressed_data, checkpoint, size):
+    # Decode at most size bytes of the buffer compressed_data starting at checkpoint, without going through what is before
+    decode_groups = get_compiled_decoder(lzss_config)
+    dictionary_size = lzss_config.dictionary_size
+    output = bytearray(checkpoint.dictionary)
+    # output[i] is history byte i + checkpoint.decompressed_pos, history starting with the initial dictionary
+    decode_groups(as_byte_view(compressed_data), checkpoint.compressed_pos, True, output, checkpoint.decompressed_pos, dictionary_size + size)
+    return bytes(output[dictionary_size:dictionary_size + size])
+
+
+class LzssReader(io.RawIOBase):
+    # Read-only file object returning the decompressed content of a stream or buffer, see iter_decode()
+    def __init__(self, source, lzss_config, chunk_size=DEFAULT_CHUNK_SIZE, checkpoints=None):
+        self.blocks = iter_decode(source, lzss_config, chunk_size, checkpoints)
+        self.buffer = b""
+        self.buffer_pos = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self.buffer_pos >= len(self.buffer):
+            self.buffer = next(self.blocks, None)
+            self.buffer_pos = 0
+            if self.buffer is None:
+                self.buffer = b""
+                return 0
+        count = min(len(b), len(self.buffer) - self.buffer_pos)
+        b[:count] = self.buffer[self.buffer_pos:self.buffer_pos + count]
+        self.buffer_pos += count
+        return count
+
+    def close(self):
+        # Also releases the view of a buffer source, an mmap can't be closed while it is in use
+        if hasattr(self, "blocks"):
+            self.blocks.close()
+        super().close()
+
+
+class ContainerReader(LzssReader):
+    # LzssReader over a compressed file of the given profiles.FormatProfile, or of the one its magic belongs to
+    # The header is read and checked right away, a buffer source is decoded from a view starting after it without copying
+    # Checkpoint positions are relative to the end of the header
+    def __init__(self, source, chunk_size=DEFAULT_CHUNK_SIZE, checkpoints=None, profile=None):
+        data = buffer_view(source)
+        try:
+            if data is None:
+                header = source.read(profile.header_size if profile is not None else MIN_HEADER_SIZE)
+            else:
+                header = bytes(data[:MAX_HEADER_SIZE])
+            if profile is None:
+                profile = container_profile(header)
+            if data is None:
+                header += source.read(max(0, profile.header_size - len(header)))
+            self.uncompressed_size = profile.read_header(header)
+        except ValueError:
+            if data is not None:
+                data.release()
+            raise
+        self.profile = profile
+        if data is not None:
+            source = data[profile.header_size:]
+        super().__init__(source, profile.lzss_config, chunk_size, checkpoints)
+
+
+class CmpsReader(ContainerReader):
+    # ContainerReader that only accepts CMPS files
+    def __init__(self, source, chunk_size=DEFAULT_CHUNK_SIZE, checkpoints=None):
+        super().__init__(source, chunk_size, checkpoints, CMPS_PROFILE)
+
+
+flag_tables = {}
+compiled_decoder_arguments = {}
+
+
+def get_flag_table(lzss_config):
+    # flag_table[8 * flags_byte + i] is 1 when operation i of a group starting with flags_byte is a pointer
+    key = lzss_config_key(lzss_config)
+    flag_table = flag_tables.get(key)
+    if flag_table is None:
+        flag_table = bytes(bool(flag_is_pointer(flags_byte, flag_index, lzss_config)) for flags_byte in range(256) for flag_index in range(8))
+        flag_tables[key] = flag_table
+    return flag_table
+
+
+def lzss_decode_c(lzss_config, compressed_data, uncompressed_size=0):
+    # Decoder of the compiled lzss_accel extension, it takes the flag table of flag_is_pointer() and the config as is
+    # Its output is allocated for uncompressed_size bytes at once, the data can still decode to more or less
+    if lzss_accel is None:
+        raise ImportError("The 'c' decoder engine requires the lzss_accel extension, build it with: python setup.py build_ext --inplace")
+    key = lzss_config_key(lzss_config)
+    arguments = compiled_decoder_arguments.get(key)
+    if arguments is None:
+        arguments = (get_flag_table(lzss_config), lzss_config.dictionary_size, lzss_config.dictionary_start_position, lzss_config.min_match_size,
+                     lzss_config.length_bit_size, lzss_config.offset_bit_size, lzss_config.relative_offset)
+        compiled_decoder_arguments[key] = arguments
+    return lzss_accel.decode(compressed_data, *arguments, uncompressed_size)
+
+
+# uncompressed_size, the size from the header when there is one, only sizes the output buffer of the c engine: the
+# Python engines grow theirs, and every engine decodes up to the end of the data whatever it says
+DECODER_ENGINES = {
+    "reference": lzss_decode_reference,
+    "fast": lzss_decode_fast,
+    "c": lzss_decode_c,
+}
+
+DEFAULT_DECODER_ENGINE = "c" if lzss_accel is not None else "fast"
+
+# Files larger than this once uncompressed are decoded block by block by ContainerReader instead of at once, whatever
+# the decoder, so that their output is never held in memory as a whole
+MAX_WHOLE_DECODE_SIZE = 64 * 1024 * 1024
+
+
+def lzss_decode(lzss_config, compressed_data, engine=DEFAULT_DECODER_ENGINE, stats=None, uncompressed_size=0):
+    # stats is an optional codec_stats.CodecStats the operations and time spent are added to
+    if engine not in DECODER_ENGINES:
+        raise ValueError(f"Unknown decoder engine '{engine}', expected one of: {', '.join(DECODER_ENGINES)}")
+    if stats is None:
+        return DECODER_ENGINES[engine](lzss_config, compressed_data, uncompressed_size)
+
+    with stats.phase("decode"):
+        decompressed_data = DECODER_ENGINES[engine](lzss_config, compressed_data, uncompressed_size)
+    stats.count_operations(lzss_config, compressed_data)
+    return decompressed_data
+
+
+group_tables = {}
+
+
+def get_group_tables(lzss_config):
+    # For every flags byte: the size of its whole group, the bytes its literals and shortest matches give and the
+    # offsets of the length bytes of its pointers from the flags byte
+    key = lzss_config_key(lzss_config)
+    tables = group_tables.get(key)
+    if tables is None:
+        flag_table = get_flag_table(lzss_config)
+        group_sizes, base_outputs, length_offsets = [], [], []
+        for flags_byte in range(256):
+            offsets = []
+            size = 1
+            for is_pointer in flag_table[8 * flags_byte:8 * flags_byte + 8]:
+                if is_pointer:
+                    offsets.append(size + 1)
+                size += 2 if is_pointer else 1
+            group_sizes.append(size)
+            base_outputs.append(8 - len(offsets) + len(offsets) * lzss_config.min_match_size)
+            length_offsets.append(tuple(offsets))
+        tables = group_tables[key] = (group_sizes, base_outputs, length_offsets)
+    return tables
+
+
+def walk_operations_python(lzss_config, compressed_data, uncompressed_size):
+    # Follows the flags, literals and pointers of compressed_data like the decoders, without writing anything, until
+    # uncompressed_size bytes are reached or the data ends. Returns (decompressed size, position in compressed_data,
+    # whether the walk stopped on a pointer cut by the end of the data).
+    flag_table = get_flag_table(lzss_config)
+    group_sizes, base_outputs, length_offsets = get_group_tables(lzss_config)
+    length_mask = (1 << lzss_config.length_bit_size) - 1
+    min_match_size = lzss_config.min_match_size
+    data = compressed_data
+    input_size = len(data)
+    pos = 0
+    output_size = 0
+
+    while pos < input_size and output_size < uncompressed_size:
+        # Whole groups at once, as long as they are complete and don't go past uncompressed_size
+        flags_byte = data[pos]
+        group_end = pos + group_sizes[flags_byte]
+        if group_end <= input_size:
+            group_output = base_outputs[flags_byte]
+            for offset in length_offsets[flags_byte]:
+                group_output += data[pos + offset] & length_mask
+            if output_size + group_output <= uncompressed_size:
+                output_size += group_output
+                pos = group_end
+                continue
+
+        # The last group, one operation at a time
+        flags_index = 8 * flags_byte
+        pos += 1
+        for is_pointer in flag_table[flags_index:flags_index + 8]:
+            if is_pointer:
+                if pos + 2 > input_size:
+                    return output_size, pos, pos < input_size
+                output_size += (data[pos + 1] & length_mask) + min_match_size
+                pos += 2
+            else:
+                if pos >= input_size:
+                    return output_size, pos, False
+                output_size += 1
+                pos += 1
+            if output_size >= uncompressed_size:
+                return output_size, pos, False
+    return output_size, pos, False
+
+
+def walk_operations_c(lzss_config, compressed_data, uncompressed_size):
+    if lzss_accel is None:
+        raise ImportError("The 'c' verify engine requires the lzss_accel extension, build it with: python setup.py build_ext --inplace")
+    return lzss_accel.verify(compressed_data, get_flag_table(lzss_config), lzss_config.min_match_size, lzss_config.length_bit_size,
+                             uncompressed_size)
+
+
+VERIFY_ENGINES = {
+    "python": walk_operations_python,
+    "c": walk_operations_c,
+}
+
+DEFAULT_VERIFY_ENGINE = "c" if lzss_accel is not None else "python"
+
+
+def lzss_verify(lzss_config, compressed_data, uncompressed_size, engine=DEFAULT_VERIFY_ENGINE):
+    # Checks that compressed_data decodes to exactly uncompressed_size bytes and ends there, without decoding it
+    # Any 2 byte pointer is a valid reference to the dictionary, so a damaged stream shows as a pointer cut by the end of
+    # the data, a size that differs from uncompressed_size or bytes left after the last operation
+    # Raises ValueError describing the first problem found
+    if engine not in VERIFY_ENGINES:
+        raise ValueError(f"Unknown verify engine '{engine}', expected one of: {', '.join(VERIFY_ENGINES)}")
+    decompressed_size, pos, truncated = VERIFY_ENGINES[engine](lzss_config, compressed_data, uncompressed_size)
+    if truncated:
+        raise ValueError(f"Pointer cut by the end of the data after {decompressed_size} of {uncompressed_size} bytes")
+    if decompressed_size < uncompressed_size:
+        raise ValueError(f"The data ends after {decompressed_size} of {uncompressed_size} bytes")
+    if decompressed_size > uncompressed_size:
+        raise ValueError(f"The last operation ends at byte {decompressed_size}, past the {uncompressed_size} bytes of the header")
+    if pos < len(compressed_data):
+        raise ValueError(f"{len(compressed_data) - pos} byte(s) of trailing data after the last operation")
+
+
+def read_cmps_header(data):
+    # Returns the uncompressed size stored in the CMPS header at the start of data
+    return CMPS_PROFILE.read_header(data)
+
+
+def container_decode(data, engine=DEFAULT_DECODER_ENGINE, stats=None, profile=None):
+    # Decompress a whole compressed file held in memory (bytes, mmap, ...) straight from a view after its header
+    # profile is a profiles.FormatProfile, found from the magic of data when not given
+    if profile is None:
+        profile = container_profile(data)
+    uncompressed_size = profile.read_header(data)
+    with as_byte_view(data)[profile.header_size:] as compressed_data:
+        return lzss_decode(profile.lzss_config, compressed_data, engine, stats, uncompressed_size)
+
+
+def cmps_decode(data, engine=DEFAULT_DECODER_ENGINE, stats=None):
+    return container_decode(data, engine, stats, CMPS_PROFILE)
+
+
+def container_verify(data, engine=DEFAULT_VERIFY_ENGINE, profile=None):
+    # lzss_verify() of a whole compressed file against the size in its header, returns that size
+    if profile is None:
+        profile = container_profile(data)
+    uncompressed_size = profile.read_header(data)
+    with as_byte_view(data)[profile.header_size:] as compressed_data:
+        lzss_verify(profile.lzss_config, compressed_data, uncompressed_size, engine)
+    return uncompressed_size
+
+
 def decode_lzss_file(input_file, output_file):
     # Read the input file
     with open(input_file, "rb") as f:
         input_data = f.read()
 
-    # Skip the first 8 bytes
-    input_data = input_data[8:]
-
-    lzss_config = LzssConfig()
-    lzss_config.dictionary_start_position = 958
-    lzss_config.flag_set_is_pointer = False
-    lzss_config.relative_offset = False
-
-    # Call lzss_decode with the input data
-    decompressed_data = lzss_decode(lzss_config, input_data)
+    # The header tells the container (LZSS, or CMPS) and so the parameters, see profiles.py
+    decompressed_data = container_decode(input_data)
 
     # Write the output to the output file
     with open(output_file, "wb") as f:
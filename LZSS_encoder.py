@@ -2,8 +2,17 @@
 # MODIFIED 6/20/2024: CHANGED POINTER AND LENGTH SIZES, COMMENTED OUT PRINT STATEMENTS, REMOVED HARDCODED DICTIONARY SIZE, AND ADDED NOTICE OF ORIGINAL AUTHOR
 #! /usr/bin/env python3
 
+import io
 import sys
-from helpers import Dictionary, LzssConfig, array_to_hexstring, set_bit
+import time
+from array import array
+from helpers import Dictionary, LzssConfig, array_to_hexstring, set_bit, cmps_header
+from profiles import CMPS_PROFILE, LZSS_PROFILE
+
+try:
+    import lzss_accel
+except ImportError:
+    lzss_accel = None
 
 
 # ABOUT LZSS
@@ -29,6 +38,39 @@ MAX_MATCH_SIZE = MATCH_SIZE + MIN_MATCH_SIZE - 1  # Since we will never encode a
                                                   # So we used those values to encode from MIN_MATCH_SIZE to MATCH_SIZE + MIN_MATCH_SIZE
                                                   # For example, instead of from 0 to 63 we encode 3 to 66
 
+ENCODER_VERSION = 1  # Must change whenever the output for the same input and settings changes, it invalidates cached results
+
+# Linear dictionary addresses searched by the original encoder (0 is the oldest byte of the ring, DICTIONARY_SIZE-1 the newest)
+# Matches are only looked up in [SEARCH_WINDOW_START, SEARCH_WINDOW_END), which is what keeps repacked files identical to the originals
+SEARCH_WINDOW_START, SEARCH_WINDOW_END = CMPS_PROFILE.search_window
+
+# Window used by the max ratio mode, every byte of the dictionary can be referenced
+# Address 0 is the byte about to be overwritten, so matches there (and above DICTIONARY_SIZE - MAX_MATCH_SIZE) overlap the
+# bytes being written, which lzss_decode() handles since it copies one byte at a time
+FULL_WINDOW_START = 0
+FULL_WINDOW_END   = DICTIONARY_SIZE
+
+# Cost of every operation in bits, including its flag bit
+LITERAL_COST_BITS = 1 + 8
+POINTER_COST_BITS = 1 + 16
+
+HASH_CHAIN_PURGE_INTERVAL = 64 * 1024
+
+# Input positions NumpyMatchFinder searches at once
+NUMPY_BLOCK_SIZE = 256
+
+# Literal runs (skip_incompressible): the input is parsed LITERAL_RUN_SAMPLE_SIZE bytes at a time and a block where less
+# than 1/LITERAL_RUN_MATCH_RATIO of the bytes were matched is followed by LITERAL_RUN_MIN_SIZE literals written without
+# searching. The run doubles, up to LITERAL_RUN_MAX_SIZE, while the blocks searched between the runs stay incompressible.
+LITERAL_RUN_SAMPLE_SIZE = 128
+LITERAL_RUN_MATCH_RATIO = 16
+LITERAL_RUN_MIN_SIZE = 1024
+LITERAL_RUN_MAX_SIZE = 4 * 1024
+
+# lzss_reencode() with the c engine leaves the rest of the input to lzss_encode_c() after this many bytes parsed or
+# repacked one operation at a time
+REENCODE_RESYNC_LIMIT = 16 * 1024
+
 
 def encode_pointer_and_length(match_pos, match_len):
     # Match size is offsetted so that smallest possible match start at zero
@@ -43,7 +85,520 @@ def encode_pointer_and_length(match_pos, match_len):
     return byte1, byte2
 
 
-def lzss_encode(raw_input):
+class EncoderFormat:
+    # The encoder settings of a format profile: the dictionary, the longest match, how pointers and flags are written and
+    # the linear addresses searched. Pointers are always 2 bytes, the offset being split between both of them.
+    def __init__(self, lzss_config, window_start, window_end):
+        if not lzss_config.first_flag_is_lsb:
+            raise ValueError("The encoder only writes the flags LSB first")
+        if lzss_config.min_match_size != MIN_MATCH_SIZE:
+            raise ValueError(f"The encoder only writes matches of at least {MIN_MATCH_SIZE} bytes")
+        if not 8 <= lzss_config.offset_bit_size <= 15 or lzss_config.offset_bit_size + lzss_config.length_bit_size != 16 \
+                or lzss_config.dictionary_size != 1 << lzss_config.offset_bit_size:
+            raise ValueError("The encoder only writes 2 byte pointers reaching the whole dictionary")
+        if not 0 <= window_start < window_end <= lzss_config.dictionary_size:
+            raise ValueError("The search window must be within the dictionary")
+
+        self.dictionary_size = lzss_config.dictionary_size
+        self.dictionary_start = lzss_config.dictionary_start_position
+        self.max_match_size = (1 << lzss_config.length_bit_size) + MIN_MATCH_SIZE - 1
+        self.length_bit_size = lzss_config.length_bit_size
+        self.relative_offset = lzss_config.relative_offset
+        self.literal_flag_set = not lzss_config.flag_set_is_pointer
+        self.window_start = window_start
+        self.window_end = window_end
+
+    def match_finder(self, engine, raw_input, max_chain_length=0):
+        # Only the hash chains can be cut short, max_chain_length is refused by lzss_encode() for the other engines
+        options = {"max_chain_length": max_chain_length} if max_chain_length else {}
+        return MATCH_FINDERS[engine](raw_input, self.window_start, self.window_end,
+                                     dictionary_size=self.dictionary_size, max_match_size=self.max_match_size, **options)
+
+
+encoder_formats = {}
+
+
+def get_encoder_format(profile=CMPS_PROFILE, max_ratio=False):
+    # The max ratio mode searches the whole dictionary instead of the window of the profile
+    key = (profile, max_ratio)
+    if key not in encoder_formats:
+        window = (0, profile.lzss_config.dictionary_size) if max_ratio else profile.search_window
+        encoder_formats[key] = EncoderFormat(profile.lzss_config, *window)
+    return encoder_formats[key]
+
+
+class HashChainMatchFinder:
+    # Index of every 3-byte prefix seen in the ring buffer, kept as hash chains
+    #
+    # The encoder history is modelled as the initial (zeroed) dictionary followed by the input, so linear dictionary address
+    # "addr" at input position "input_pos" is history position input_pos + addr. For every position we remember the previous
+    # position that started with the same 3 bytes, which lets find_match() visit only the candidates that can give a match.
+    #
+    # More input can be added with append() and history that can no longer be matched dropped with discard(), so the finder
+    # also works on a stream. history[0] is history position history_base.
+    def __init__(self, raw_input, window_start=SEARCH_WINDOW_START, window_end=SEARCH_WINDOW_END, max_chain_length=0,
+                 dictionary_size=DICTIONARY_SIZE, max_match_size=MAX_MATCH_SIZE):
+        self.history = bytearray(dictionary_size) + raw_input
+        self.history_base = 0
+        self.window_start = window_start
+        self.window_end = window_end
+        self.max_chain_length = max_chain_length  # 0 means follow the whole chain
+        self.dictionary_size = dictionary_size
+        self.max_match_size = max_match_size
+        # The ring of previous positions must be a power of two larger than dictionary_size + max_match_size
+        self.ring_mask = (1 << (dictionary_size + max_match_size).bit_length()) - 1
+        self.head = {}
+        self.prev = [-1] * (self.ring_mask + 1)
+        self.next_insert = 0
+        self.next_purge = HASH_CHAIN_PURGE_INTERVAL
+        self.positions_searched = 0
+        self.candidates_scanned = 0
+
+    def append(self, data):
+        self.history += data
+
+    def discard(self, input_pos):
+        # Drop the history that input_pos and later positions can no longer reference
+        count = input_pos + self.window_start - self.history_base
+        if count > 0:
+            del self.history[:count]
+            self.history_base += count
+
+    def skip_to(self, input_pos):
+        # Start indexing at the window of input_pos, for an encoder resumed there with nothing encoded before
+        self.next_insert = max(self.next_insert, input_pos + self.window_start)
+
+    def advance(self, input_pos):
+        # Index all history positions that are inside the search window of input_pos
+        history = self.history
+        base = self.history_base
+        head = self.head
+        prev = self.prev
+        mask = self.ring_mask
+        end = min(input_pos + self.window_end - 1, base + len(history) - MIN_MATCH_SIZE)
+        for pos in range(self.next_insert, end + 1):
+            local = pos - base
+            key = (history[local] << 16) | (history[local + 1] << 8) | history[local + 2]
+            prev[pos & mask] = head.get(key, -1)
+            head[key] = pos
+        if end >= self.next_insert:
+            self.next_insert = end + 1
+
+        # Forget the prefixes only seen outside of the window, or the table keeps every prefix of the input
+        if self.next_insert >= self.next_purge:
+            lowest = input_pos + self.window_start
+            self.head = {key: pos for key, pos in head.items() if pos >= lowest}
+            self.next_purge = self.next_insert + HASH_CHAIN_PURGE_INTERVAL
+
+    def find_match(self, input_pos, max_len):
+        # Returns (match_len, linear address) of the longest match, the newest one on ties, or (0, 0) if there is none
+        # This is the same choice the original encoder makes with its ">=" comparison on an ascending scan
+        if max_len < MIN_MATCH_SIZE:
+            return 0, 0
+
+        self.advance(input_pos)
+
+        history = self.history
+        base = self.history_base
+        prev = self.prev
+        mask = self.ring_mask
+        target = self.dictionary_size + input_pos - base
+        lowest = input_pos + self.window_start
+        highest = input_pos + self.window_end - 1
+
+        key = (history[target] << 16) | (history[target + 1] << 8) | history[target + 2]
+        pos = self.head.get(key, -1)
+        # Skip what was indexed for a later position, when a position is asked again
+        while pos > highest:
+            pos = prev[pos & mask]
+
+        best_len = 0
+        best_pos = 0
+        chain_limit = self.max_chain_length or sys.maxsize
+        chain_left = chain_limit
+        while pos >= lowest:
+            chain_left -= 1
+            local = pos - base
+            # Cheap rejection: a better candidate has to match the byte just past the current best
+            if best_len == 0 or history[local + best_len] == history[target + best_len]:
+                length = MIN_MATCH_SIZE
+                while length < max_len and history[local + length] == history[target + length]:
+                    length += 1
+                if length > best_len:
+                    best_len = length
+                    best_pos = pos
+                    if length == max_len:
+                        break
+            if chain_left == 0:
+                break
+            pos = prev[pos & mask]
+
+        self.positions_searched += 1
+        self.candidates_scanned += chain_limit - chain_left
+        if best_len == 0:
+            return 0, 0
+        return best_len, best_pos - input_pos
+
+
+class NumpyMatchFinder:
+    # Vectorized version of the original window scan, over NUMPY_BLOCK_SIZE input positions at a time
+    #
+    # The history (initial dictionary followed by the input) is kept as a NumPy array. For a candidate address a, byte j
+    # of the match at input position t compares history[t + a + j] with the input byte at t + j, so all the positions of
+    # a block share the comparisons of one row per address along its diagonal. A handful of array operations compares
+    # the whole window with the whole block at once and find_match() takes its answers from there while the parser stays
+    # in the block, instead of building the windows again for every position.
+    def __init__(self, raw_input, window_start=SEARCH_WINDOW_START, window_end=SEARCH_WINDOW_END,
+                 dictionary_size=DICTIONARY_SIZE, max_match_size=MAX_MATCH_SIZE):
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError("The 'numpy' encoder engine requires NumPy to be installed") from None
+
+        self.np = numpy
+        self.input_size = len(raw_input)
+        # Padded so that the comparisons of the last block never run past the end, the lengths are cut to the input
+        self.history = numpy.concatenate((numpy.zeros(dictionary_size, dtype=numpy.uint8), numpy.frombuffer(raw_input, dtype=numpy.uint8),
+                                          numpy.zeros(NUMPY_BLOCK_SIZE + max_match_size, dtype=numpy.uint8)))
+        self.window_start = window_start
+        self.window_end = window_end
+        self.dictionary_size = dictionary_size
+        self.max_match_size = max_match_size
+        self.block_start = 0
+        self.block_equal = None
+        self.block_lengths = []
+        self.block_addrs = []
+        self.positions_searched = 0
+        self.candidates_scanned = 0
+
+    def skip_to(self, input_pos):
+        # Every search scans its window directly, there is no index to skip ahead or to catch up
+        pass
+
+    def advance(self, input_pos):
+        pass
+
+    def search_block(self, block_start):
+        np = self.np
+        block_size = min(NUMPY_BLOCK_SIZE, self.input_size - block_start)
+        window_size = self.window_end - self.window_start
+        span = block_size + self.max_match_size
+
+        # Row k compares the bytes from linear address window_start + k on with the input from block_start on
+        first = block_start + self.window_start
+        rows = np.lib.stride_tricks.sliding_window_view(self.history[first:first + window_size - 1 + span], span)
+        target = self.history[self.dictionary_size + block_start:self.dictionary_size + block_start + span]
+        equal = rows == target
+
+        # Candidates starting with the same MIN_MATCH_SIZE bytes
+        prefix = equal[:, :block_size].copy()
+        for offset in range(1, MIN_MATCH_SIZE):
+            prefix &= equal[:, offset:offset + block_size]
+        candidate_count = np.count_nonzero(prefix)
+
+        self.block_start = block_start
+        if candidate_count * (self.max_match_size - MIN_MATCH_SIZE) >= equal.size:
+            # Mostly candidates (zero padding, short periods): the matches are long and the parser skips most of the
+            # block, so only the positions it asks for are searched, by search_position()
+            self.block_equal = equal
+            self.block_lengths = [None] * block_size
+            self.block_addrs = [0] * block_size
+            return
+
+        # Few candidates: they are all extended at once and the longest of every position kept, the last candidate on
+        # ties as with the ">=" comparison of the reference scan
+        candidate_rows, candidate_columns = np.nonzero(prefix)
+        extension = np.arange(MIN_MATCH_SIZE, self.max_match_size)
+        matched = equal[candidate_rows[:, None], candidate_columns[:, None] + extension]
+        lengths = MIN_MATCH_SIZE + np.cumprod(matched, axis=1, dtype=np.int32).sum(axis=1)
+        lengths = np.minimum(lengths, self.input_size - block_start - candidate_columns)
+        best = np.full(block_size, -1, dtype=np.int64)
+        np.maximum.at(best, candidate_columns, lengths.astype(np.int64) * window_size + candidate_rows)
+        self.block_equal = None
+        self.block_lengths = np.where(best >= 0, best // window_size, 0).tolist()
+        self.block_addrs = np.where(best >= 0, best % window_size + self.window_start, 0).tolist()
+
+    def search_position(self, index, max_len):
+        np = self.np
+        equal = self.block_equal[:, index:index + max_len]
+        lengths = np.where(equal.all(axis=1), max_len, equal.argmin(axis=1))
+        best_len = int(lengths.max())
+        if best_len >= MIN_MATCH_SIZE:
+            # Last candidate with the best length wins, as with the ">=" comparison of the reference scan
+            self.block_addrs[index] = self.window_end - 1 - int(np.argmax(lengths[::-1] == best_len))
+        else:
+            best_len = 0
+        self.block_lengths[index] = best_len
+
+    def find_match(self, input_pos, max_len):
+        # Returns (match_len, linear address) with the same tie-break as HashChainMatchFinder.find_match()
+        if max_len < MIN_MATCH_SIZE:
+            return 0, 0
+        if max_len != min(self.max_match_size, self.input_size - input_pos):
+            raise ValueError("NumpyMatchFinder only searches up to the longest match the format allows")
+        index = input_pos - self.block_start
+        if not 0 <= index < len(self.block_lengths):
+            self.search_block(input_pos)
+            index = 0
+        if self.block_lengths[index] is None:
+            self.search_position(index, max_len)
+        self.positions_searched += 1
+        self.candidates_scanned += self.window_end - self.window_start
+        return self.block_lengths[index], self.block_addrs[index]
+
+
+class TimedMatchFinder:
+    # Adds the time spent in find_match() to the "match search" phase of stats, only used when stats are collected
+    def __init__(self, match_finder, stats):
+        self.match_finder = match_finder
+        self.max_match_size = match_finder.max_match_size
+        self.stats = stats
+
+    def find_match(self, input_pos, max_len):
+        start = time.perf_counter()
+        result = self.match_finder.find_match(input_pos, max_len)
+        self.stats.add_time("match search", time.perf_counter() - start)
+        return result
+
+
+def parse_greedy(match_finder, input_size, input_pos=0, stop_pos=None):
+    # Same parse as lzss_encode_reference(): always take the longest match at the current position
+    # Yields (match_len, match_addr) for every operation starting before stop_pos, match_len 0 being a literal
+    if stop_pos is None:
+        stop_pos = input_size
+    max_match_size = match_finder.max_match_size
+
+    while input_pos < stop_pos:
+        match_len, match_addr = match_finder.find_match(input_pos, min(max_match_size, input_size - input_pos))
+        yield match_len, match_addr
+        input_pos += match_len or 1
+
+
+def parse_lazy(match_finder, input_size, input_pos=0, stop_pos=None):
+    # One step look-ahead: if the next position has a longer match, write a literal now and take that match instead
+    if stop_pos is None:
+        stop_pos = input_size
+    max_match_size = match_finder.max_match_size
+
+    match_len, match_addr = 0, 0
+    have_match = False
+
+    while input_pos < stop_pos:
+        if not have_match:
+            match_len, match_addr = match_finder.find_match(input_pos, min(max_match_size, input_size - input_pos))
+        have_match = False
+
+        if match_len and input_pos + 1 < input_size:
+            next_len, next_addr = match_finder.find_match(input_pos + 1, min(max_match_size, input_size - input_pos - 1))
+            if next_len > match_len:
+                yield 0, 0
+                input_pos += 1
+                match_len, match_addr = next_len, next_addr
+                have_match = True
+                continue
+
+        yield match_len, match_addr
+        input_pos += match_len or 1
+
+
+def parse_optimal(match_finder, input_size, input_pos=0, stop_pos=None):
+    # Shortest path from input_pos to the end of the input using the cost of every operation (all formats use 2 byte pointers)
+    # Every prefix of the longest match at a position is a valid match too, so all of them are considered
+    # The whole input is needed to find the path, so stop_pos can only be the end of the input
+    if stop_pos is not None and stop_pos != input_size:
+        raise ValueError("The optimal parser works on the whole input")
+
+    cost_size = input_size - input_pos
+    max_match_size = match_finder.max_match_size
+    cost = [0] + [(LITERAL_COST_BITS + 1) * cost_size + 1] * cost_size
+    step_len = [0] * (cost_size + 1)
+    step_addr = [0] * (cost_size + 1)
+
+    for index in range(cost_size):
+        current_cost = cost[index]
+
+        literal_cost = current_cost + LITERAL_COST_BITS
+        if literal_cost < cost[index + 1]:
+            cost[index + 1] = literal_cost
+            step_len[index + 1] = 0
+
+        match_len, match_addr = match_finder.find_match(input_pos + index, min(max_match_size, cost_size - index))
+        pointer_cost = current_cost + POINTER_COST_BITS
+        for length in range(MIN_MATCH_SIZE, match_len + 1):
+            if pointer_cost < cost[index + length]:
+                cost[index + length] = pointer_cost
+                step_len[index + length] = length
+                step_addr[index + length] = match_addr
+
+    operations = []
+    index = cost_size
+    while index > 0:
+        length = step_len[index]
+        operations.append((length, step_addr[index]))
+        index -= length or 1
+
+    return reversed(operations)
+
+
+PARSERS = {
+    "greedy": parse_greedy,
+    "lazy": parse_lazy,
+    "optimal": parse_optimal,
+}
+
+DEFAULT_PARSER = "greedy"
+
+# Compression levels from the fastest to the smallest output, as (max_ratio, parser, max_chain_length). Every level
+# searches the whole dictionary, only the settings without a level give files identical to the ones of the game.
+#   1: only the newest position starting with the same 3 bytes is tried, everything else is a literal
+#   2-3: a few candidates per position
+#   4: the longest match of the whole dictionary, same as max_ratio
+#   5-6: the lazy and optimal parsers over the whole dictionary
+ENCODER_LEVELS = {
+    1: (True, "greedy", 1),
+    2: (True, "greedy", 4),
+    3: (True, "greedy", 32),
+    4: (True, "greedy", 0),
+    5: (True, "lazy", 0),
+    6: (True, "optimal", 0),
+}
+
+
+def encoder_level(level):
+    # The lzss_encode() keyword arguments of a level: lzss_encode(data, **encoder_level(3))
+    if level not in ENCODER_LEVELS:
+        raise ValueError(f"Unknown compression level {level}, expected one of: {', '.join(map(str, ENCODER_LEVELS))}")
+    max_ratio, parser, max_chain_length = ENCODER_LEVELS[level]
+    return {"max_ratio": max_ratio, "parser": parser, "max_chain_length": max_chain_length}
+
+
+class OperationPacker:
+    # Writes the operations from one of the parsers as groups of a flags byte followed by up to 8 literals/pointers
+    def __init__(self, encoder_format=None):
+        self.format = encoder_format or get_encoder_format()
+        self.input_pos = 0
+        self.flags_byte = 0
+        self.flag_cnt = 0
+        self.current_loop_output = bytearray()
+
+    def pack(self, operations, raw_input, encoded_output, raw_input_pos=0):
+        # Append every group completed by operations to encoded_output, raw_input[0] being input position raw_input_pos
+        input_pos = self.input_pos
+        flags_byte = self.flags_byte
+        flag_cnt = self.flag_cnt
+        current_loop_output = self.current_loop_output
+        encoder_format = self.format
+        dictionary_mask = encoder_format.dictionary_size - 1
+        dictionary_start = encoder_format.dictionary_start
+        length_bit_size = encoder_format.length_bit_size
+        relative_offset = encoder_format.relative_offset
+        literal_flag_set = encoder_format.literal_flag_set
+
+        for match_len, match_addr in operations:
+            if match_len == 0:
+                # Write literal to the output
+                if literal_flag_set:
+                    flags_byte = set_bit(flags_byte, flag_cnt)
+                current_loop_output.append(raw_input[input_pos - raw_input_pos])
+                input_pos += 1
+            else:
+                # Write pointer to the output, the ring head is where the dictionary would be after input_pos bytes
+                if not literal_flag_set:
+                    flags_byte = set_bit(flags_byte, flag_cnt)
+                if relative_offset:
+                    match_pos = (dictionary_mask - match_addr) & dictionary_mask
+                else:
+                    match_pos = (dictionary_start + input_pos + match_addr) & dictionary_mask
+                current_loop_output.append(match_pos & 0xFF)
+                current_loop_output.append(((match_pos >> 8) << length_bit_size) | (match_len - MIN_MATCH_SIZE))
+                input_pos += match_len
+
+            flag_cnt += 1
+            if flag_cnt == 8:
+                encoded_output.append(flags_byte)
+                encoded_output.extend(current_loop_output)
+                flags_byte = 0
+                flag_cnt = 0
+                current_loop_output = bytearray()
+
+        self.input_pos = input_pos
+        self.flags_byte = flags_byte
+        self.flag_cnt = flag_cnt
+        self.current_loop_output = current_loop_output
+
+    def pack_literals(self, count, raw_input, encoded_output, raw_input_pos=0):
+        # count literals, the groups between the first and the last one are written at once with every flag a literal
+        head = min(count, -self.flag_cnt % 8)
+        self.pack([(0, 0)] * head, raw_input, encoded_output, raw_input_pos)
+        count -= head
+        group_count = count // 8
+        if group_count:
+            start = self.input_pos - raw_input_pos
+            groups = bytearray(9 * group_count)
+            groups[0::9] = (b"\xFF" if self.format.literal_flag_set else b"\x00") * group_count
+            for index in range(8):
+                groups[1 + index::9] = raw_input[start + index:start + 8 * group_count:8]
+            encoded_output.extend(groups)
+            self.input_pos += 8 * group_count
+        self.pack([(0, 0)] * (count - 8 * group_count), raw_input, encoded_output, raw_input_pos)
+
+    def flush(self, encoded_output):
+        # Append the last, partial group
+        if self.flag_cnt:
+            encoded_output.append(self.flags_byte)
+            encoded_output.extend(self.current_loop_output)
+            self.flags_byte = 0
+            self.flag_cnt = 0
+            self.current_loop_output = bytearray()
+
+
+def pack_operations(raw_input, operations, encoder_format=None):
+    encoded_output = bytearray()
+    packer = OperationPacker(encoder_format)
+    packer.pack(operations, raw_input, encoded_output)
+    packer.flush(encoded_output)
+    return encoded_output
+
+
+def pack_with_literal_runs(raw_input, parse, match_finder, encoder_format=None, search=None):
+    # pack_operations() for skip_incompressible, see LITERAL_RUN_SAMPLE_SIZE. Random or already compressed data is then
+    # mostly copied by pack_literals() instead of searched position by position, and the search resumes after every run
+    # to see whether matches came back. Only parsers that can stop at any position (greedy, lazy) can be sampled.
+    # search is what the parser calls instead of match_finder, such as a TimedMatchFinder
+    # Returns the encoded output and the number of bytes written as literal runs
+    search = search or match_finder
+    input_size = len(raw_input)
+    encoded_output = bytearray()
+    packer = OperationPacker(encoder_format)
+    run_size = LITERAL_RUN_MIN_SIZE
+    literal_run_size = 0
+
+    while packer.input_pos < input_size:
+        block_start = packer.input_pos
+        operations = list(parse(search, input_size, block_start, min(input_size, block_start + LITERAL_RUN_SAMPLE_SIZE)))
+        packer.pack(operations, raw_input, encoded_output)
+        matched = sum(match_len for match_len, _ in operations)
+        if matched * LITERAL_RUN_MATCH_RATIO >= packer.input_pos - block_start:
+            run_size = LITERAL_RUN_MIN_SIZE
+            continue
+
+        run_end = min(input_size, packer.input_pos + run_size)
+        literal_run_size += run_end - packer.input_pos
+        packer.pack_literals(run_end - packer.input_pos, raw_input, encoded_output)
+        # The window of run_end is indexed here rather than by the first search after the run, so the time of the searched
+        # positions is that of positions in a steady run, which the stats use to estimate the time saved
+        match_finder.skip_to(run_end)
+        match_finder.advance(run_end)
+        run_size = min(2 * run_size, LITERAL_RUN_MAX_SIZE)
+
+    packer.flush(encoded_output)
+    return encoded_output, literal_run_size
+
+
+def lzss_encode_reference(raw_input):
+    # Original brute force encoder: every address of the window is compared byte by byte and the last of the longest
+    # matches wins. It is the oracle fuzz_roundtrip.py checks the other engines against, so it stays as it was written,
+    # speedups belong in the other engines.
     encoded_output = bytearray()
 
     dictionary = Dictionary(DICTIONARY_SIZE, DICTIONARY_START_POS)
@@ -54,22 +609,12 @@ def lzss_encode(raw_input):
 
         flags_byte = 0
         current_loop_output = bytearray()
-        debug_print_output = ""
 
         for flag_cnt in range(8):
 
             if input_pos >= len(raw_input):
                 break
 
-            if dictionary.pos == 24:
-                # dictionary.print_content()
-                pass
-
-            if input_pos == 1661:
-                # dictionary.print_content()
-                # breakpoint()
-                pass
-
             # Find the longest match within the window
             match_pos = 0
             match_len = 0
@@ -86,9 +631,6 @@ def lzss_encode(raw_input):
                 local_match_pos = 0
                 local_match_len = 0
 
-                if dict_itr == 18:
-                    pass
-
                 # Compare from current byte of dict with look_ahead_buffer
                 for i in range(current_look_ahead_buffer_size):
                     dict_byte = dictionary.get_byte_by_linear_addr(dict_itr + i)
@@ -102,9 +644,6 @@ def lzss_encode(raw_input):
                     # Added "=" to the check because looks like orig. encoder always set offset to the last found match
                     #   x) The search starts at HEAD 958 and overflows up to 957 where the last positive match happens
                     if local_match_len >= match_len:
-                        if dictionary.pos == 24:
-                            # print("New best match ")
-                            pass
                         match_len = local_match_len
                         match_pos = local_match_pos
 
@@ -114,17 +653,6 @@ def lzss_encode(raw_input):
             # Iterate over all bytes of dict from newest_byte - MAX_MATCH_SIZE up to the last byte of the dict
             for dict_byte_iter in range(958, 1024):
 
-                # if input_pos == 163 and dict_byte_iter == 1023:
-                if input_pos == 1661:
-                    # dictionary.print_content()
-                    #breakpoint()
-                    pass
-
-                # print(f"dict_byte_iter {dict_byte_iter}")
-
-                if dict_byte_iter == 1020:
-                    pass
-
                 local_match_pos = 0
                 local_match_len = 0
 
@@ -157,51 +685,406 @@ def lzss_encode(raw_input):
                 flags_byte = set_bit(flags_byte, flag_cnt)
                 literal = raw_input[input_pos]
 
-                if literal == 5:
-                    # breakpoint()
-                    pass
-
                 dictionary.add_byte(literal)
                 current_loop_output.append(literal)
                 input_pos += 1
-
-                #print(f"[DEBUG] [{len(encoded_output)+len(current_loop_output)}] [{input_pos-1}] Literal {literal:02X} ")
             else:
                 # Write pointer to the output
-                # dictionary.print_content()
-                #print(f"[DEBUG] [{len(encoded_output)+len(current_loop_output)+1}] [{input_pos}] Matched string, offset: {match_pos}, len: {match_len}, symbols:", end="")
                 # Add matched bytes into dictionary
                 for i in range(match_len):
-                    #value = dictionary.get_byte(match_pos + i)
                     value = look_ahead_buffer[i]
                     dictionary.add_byte(value)
-                    #print(f" {value:02X}", end="")
-                #print(" ")
 
                 byte1, byte2 = encode_pointer_and_length(match_pos, match_len)
 
                 current_loop_output.append(byte1)
                 current_loop_output.append(byte2)
                 input_pos += match_len
-                #print(f"[DEBUG] [{len(encoded_output)+len(current_loop_output)+1-2}] [{input_pos-match_len}] Ring head {dictionary.pos-match_len} ")
-                #print(f"[DEBUG] [{len(encoded_output) + len(current_loop_output) + 1 -2}] [{input_pos-match_len}] Pointer {byte1:02X} {byte2:02X} ")
-                #print(debug_print_output_local
 
-        #print(debug_print_output)
-        #print(f"[DEBUG] [{len(encoded_output)}] Flags: {flags_byte:02X} \n")
 
         encoded_output.append(flags_byte)
         encoded_output.extend(current_loop_output)
 
-    #dictionary.print_content()
+    return encoded_output
 
-    #print(f"Pointer bitsize: {POINTER_BITSIZE}")
-    #print(f"Lenght  bitsize: {LENGTH_BITSIZE}")
-    #print(f"Dictionary size: {DICTIONARY_SIZE}")
-    #print(f"Match size:      {MATCH_SIZE}")
-    #print(f"Min. Match size: {MIN_MATCH_SIZE}")
-    #print(f"Max. Match size: {MAX_MATCH_SIZE}")
 
+MATCH_FINDERS = {
+    "hashchain": HashChainMatchFinder,
+    "numpy": NumpyMatchFinder,
+}
+
+# The "c" engine is the greedy hashchain search of the compiled lzss_accel extension, the other parsers use the Python one
+ENCODER_ENGINES = ["reference"] + list(MATCH_FINDERS) + ["c"]
+C_PARSERS = ["greedy"]
+
+DEFAULT_ENCODER_ENGINE = "c" if lzss_accel is not None else "hashchain"
+
+
+def lzss_encode_c(raw_input, encoder_format=None, max_chain_length=0, skip_incompressible=False, input_pos=0):
+    # Returns the encoded output and the number of bytes written as literal runs, the same as pack_with_literal_runs()
+    # with the greedy parser when skip_incompressible is set
+    # input_pos starts the encoding there in new flag groups, raw_input[:input_pos] only being history as after
+    # HashChainMatchFinder.skip_to(input_pos)
+    if lzss_accel is None:
+        raise ImportError("The 'c' encoder engine requires the lzss_accel extension, build it with: python setup.py build_ext --inplace")
+    encoder_format = encoder_format or get_encoder_format()
+    return lzss_accel.encode(raw_input, encoder_format.window_start, encoder_format.window_end,
+                             encoder_format.dictionary_size, encoder_format.dictionary_start, encoder_format.max_match_size,
+                             encoder_format.length_bit_size, encoder_format.relative_offset, encoder_format.literal_flag_set,
+                             max_chain_length, skip_incompressible, input_pos)
+
+
+def parse_greedy_c(raw_input, input_pos=0, stop_pos=None, encoder_format=None, max_chain_length=0):
+    # parse_greedy() on the compiled search, with raw_input[:input_pos] only as history like lzss_encode_c()
+    # Returns the match_len of the operations starting before stop_pos as bytes and their match_addr as array("H") bytes
+    if lzss_accel is None:
+        raise ImportError("The 'c' encoder engine requires the lzss_accel extension, build it with: python setup.py build_ext --inplace")
+    encoder_format = encoder_format or get_encoder_format()
+    if stop_pos is None:
+        stop_pos = len(raw_input)
+    return lzss_accel.parse(raw_input, input_pos, stop_pos, encoder_format.window_start, encoder_format.window_end,
+                            encoder_format.dictionary_size, encoder_format.max_match_size, max_chain_length)
+
+
+def lzss_encode(raw_input, engine=DEFAULT_ENCODER_ENGINE, max_ratio=False, parser=DEFAULT_PARSER, stats=None, profile=CMPS_PROFILE,
+                max_chain_length=0, skip_incompressible=False):
+    # max_ratio searches the whole dictionary instead of the original window and the lazy/optimal parsers pick cheaper
+    # operations than the greedy one, the output is smaller but no longer identical to the files shipped with the game
+    # stats is an optional codec_stats.CodecStats the operations, candidates and time spent are added to
+    # profile is the profiles.FormatProfile the data is written for, only the LZSS data is returned, without the header
+    # max_chain_length tries at most that many candidates per position (0 tries all of them), see ENCODER_LEVELS
+    # skip_incompressible writes the parts of the input that hardly match as literals without searching them, see
+    # LITERAL_RUN_SAMPLE_SIZE. Faster on random or already compressed data, the output can be a little larger.
+    if engine not in ENCODER_ENGINES:
+        raise ValueError(f"Unknown encoder engine '{engine}', expected one of: {', '.join(ENCODER_ENGINES)}")
+    if parser not in PARSERS:
+        raise ValueError(f"Unknown parser '{parser}', expected one of: {', '.join(PARSERS)}")
+    if max_chain_length < 0:
+        raise ValueError("max_chain_length can't be negative")
+    if max_chain_length and engine not in ("hashchain", "c"):
+        raise ValueError("Limiting the candidates per position needs the hashchain or c engine")
+    if skip_incompressible and (engine == "reference" or parser not in STREAMING_PARSERS):
+        raise ValueError("Skipping incompressible data needs one of the indexed engines and the greedy or lazy parser")
+
+    if engine == "reference":
+        if max_ratio or parser != DEFAULT_PARSER:
+            raise ValueError("The max ratio mode and non greedy parsers need one of the indexed engines: " + ", ".join(MATCH_FINDERS))
+        if profile is not CMPS_PROFILE:
+            raise ValueError(f"The reference engine only writes CMPS data, use one of the indexed engines for {profile.name}")
+        if stats is None:
+            return lzss_encode_reference(raw_input)
+        with stats.phase("encode"):
+            encoded_output = lzss_encode_reference(raw_input)
+        stats.count_operations(profile.lzss_config, encoded_output)
+        return encoded_output
+
+    encoder_format = get_encoder_format(profile, max_ratio)
+
+    if engine == "c":
+        if parser in C_PARSERS:
+            if stats is None:
+                return lzss_encode_c(raw_input, encoder_format, max_chain_length, skip_incompressible)[0]
+            with stats.phase("encode"):
+                encoded_output, literal_run_size = lzss_encode_c(raw_input, encoder_format, max_chain_length, skip_incompressible)
+            stats.count_operations(profile.lzss_config, encoded_output)
+            stats.add_literal_runs(literal_run_size)
+            return encoded_output
+        engine = "hashchain"
+
+    match_finder = encoder_format.match_finder(engine, raw_input, max_chain_length)
+    parse = PARSERS[parser]
+    if stats is None:
+        if skip_incompressible:
+            return pack_with_literal_runs(raw_input, parse, match_finder, encoder_format)[0]
+        return pack_operations(raw_input, parse(match_finder, len(raw_input)), encoder_format)
+
+    search_seconds = stats.phase_seconds.get("match search", 0.0)
+    with stats.phase("encode"):
+        search = TimedMatchFinder(match_finder, stats)
+        if skip_incompressible:
+            encoded_output, literal_run_size = pack_with_literal_runs(raw_input, parse, match_finder, encoder_format, search)
+        else:
+            encoded_output = pack_operations(raw_input, parse(search, len(raw_input)), encoder_format)
+    stats.count_operations(profile.lzss_config, encoded_output)
+    stats.add_match_finder(match_finder)
+    if skip_incompressible and match_finder.positions_searched:
+        # Every position of the literal runs would have been searched, at the speed of the positions that were
+        search_seconds = stats.phase_seconds["match search"] - search_seconds
+        stats.add_literal_runs(literal_run_size, search_seconds * literal_run_size / match_finder.positions_searched)
+    return encoded_output
+
+
+def container_encode(raw_input, engine=DEFAULT_ENCODER_ENGINE, max_ratio=False, parser=DEFAULT_PARSER, stats=None, profile=CMPS_PROFILE,
+                     max_chain_length=0, skip_incompressible=False):
+    # lzss_encode() of raw_input preceded by the header of profile, a whole compressed file
+    return profile.header(len(raw_input)) + lzss_encode(raw_input, engine, max_ratio, parser, stats, profile, max_chain_length,
+                                                        skip_incompressible)
+
+
+STREAMING_PARSERS = ["greedy", "lazy"]
+
+
+class LzssEncoder:
+    # Incremental version of lzss_encode() using the hash chain engine
+    #
+    # feed() returns the flag groups completed by the new data and flush() the rest of the stream, together they give the
+    # same bytes as lzss_encode(). Only the dictionary window and the data not encoded yet are kept in memory.
+    def __init__(self, max_ratio=False, parser=DEFAULT_PARSER, stats=None, profile=CMPS_PROFILE, max_chain_length=0):
+        if parser not in STREAMING_PARSERS:
+            raise ValueError(f"Parser '{parser}' can't encode a stream, expected one of: {', '.join(STREAMING_PARSERS)}")
+
+        self.parse = PARSERS[parser]
+        self.profile = profile
+        self.format = get_encoder_format(profile, max_ratio)
+        self.match_finder = self.format.match_finder("hashchain", b"", max_chain_length)
+        self.search = self.match_finder if stats is None else TimedMatchFinder(self.match_finder, stats)
+        self.packer = OperationPacker(self.format)
+        self.input_size = 0
+        self.stats = stats
+
+    def feed(self, data):
+        self.match_finder.append(data)
+        self.input_size += len(data)
+        # Positions are only parsed once they have a full look-ahead buffer (plus one byte for the lazy parser),
+        # so every match is chosen exactly like lzss_encode() would
+        return self.encode(self.input_size - self.format.max_match_size - 1)
+
+    def flush(self):
+        encoded_output = self.encode(self.input_size, True)
+        if self.stats is not None:
+            self.stats.add_match_finder(self.match_finder)
+        return encoded_output
+
+    def encode(self, stop_pos, final=False):
+        if self.stats is None:
+            return self.encode_groups(stop_pos, final)
+        with self.stats.phase("encode"):
+            encoded_output = self.encode_groups(stop_pos, final)
+        # Everything returned is made of whole groups, except the last part of the stream
+        self.stats.count_operations(self.profile.lzss_config, encoded_output)
+        return encoded_output
+
+    def encode_groups(self, stop_pos, final):
+        encoded_output = bytearray()
+        match_finder = self.match_finder
+        operations = self.parse(self.search, self.input_size, self.packer.input_pos, stop_pos)
+        # The history starts with the initial dictionary, so input position 0 is at history[dictionary_size]
+        self.packer.pack(operations, match_finder.history, encoded_output, match_finder.history_base - match_finder.dictionary_size)
+        match_finder.discard(self.packer.input_pos)
+        if final:
+            self.packer.flush(encoded_output)
+        return encoded_output
+
+
+class CmpsWriter(io.RawIOBase):
+    # Write-only file object compressing everything written to it into a CMPS file on stream
+    # The header holds the uncompressed size: it is written up front when uncompressed_size is given, otherwise it is
+    # patched by close(), which then needs a seekable stream. Closing the writer leaves stream open.
+    def __init__(self, stream, uncompressed_size=None, max_ratio=False, parser=DEFAULT_PARSER, stats=None, max_chain_length=0):
+        self.stream = stream
+        self.encoder = LzssEncoder(max_ratio, parser, stats, max_chain_length=max_chain_length)
+        self.uncompressed_size = uncompressed_size
+        self.header_pos = stream.tell() if uncompressed_size is None else None
+        self.written = 0
+        stream.write(cmps_header(uncompressed_size or 0))
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.written += len(b)
+        self.stream.write(self.encoder.feed(b))
+        return len(b)
+
+    def close(self):
+        # The writer is closed even when the size doesn't match the header
+        if self.closed:
+            return
+        try:
+            self.stream.write(self.encoder.flush())
+            if self.header_pos is not None:
+                end_pos = self.stream.tell()
+                self.stream.seek(self.header_pos)
+                self.stream.write(cmps_header(self.written))
+                self.stream.seek(end_pos)
+            elif self.written != self.uncompressed_size:
+                raise ValueError(f"CMPS header says {self.uncompressed_size} bytes but {self.written} were written")
+        finally:
+            super().close()
+
+
+def iter_flag_groups(encoded_data):
+    # Yields (input_pos, encoded_pos) at the start of every flag group of a stream written by lzss_encode()
+    encoded_size = len(encoded_data)
+    input_pos = 0
+    encoded_pos = 0
+
+    while encoded_pos < encoded_size:
+        yield input_pos, encoded_pos
+        flags_byte = encoded_data[encoded_pos]
+        encoded_pos += 1
+        for flag_cnt in range(8):
+            if encoded_pos >= encoded_size:
+                break
+            if (flags_byte >> flag_cnt) & 1:
+                input_pos += 1
+                encoded_pos += 1
+            else:
+                input_pos += (encoded_data[encoded_pos + 1] & 0b00001111) + MIN_MATCH_SIZE
+                encoded_pos += 2
+
+
+def iter_operations(encoded_data, input_pos=0, encoded_pos=0):
+    # Yields (input_pos, match_len, match_addr, flag_cnt, group_pos) for every operation of a stream written by
+    # lzss_encode(), starting with the flag group at encoded_pos. group_pos is where the flag group of the operation starts.
+    encoded_size = len(encoded_data)
+
+    while encoded_pos < encoded_size:
+        group_pos = encoded_pos
+        flags_byte = encoded_data[encoded_pos]
+        encoded_pos += 1
+        for flag_cnt in range(8):
+            if encoded_pos >= encoded_size:
+                break
+            if (flags_byte >> flag_cnt) & 1:
+                yield input_pos, 0, 0, flag_cnt, group_pos
+                input_pos += 1
+                encoded_pos += 1
+            else:
+                byte1 = encoded_data[encoded_pos]
+                byte2 = encoded_data[encoded_pos + 1]
+                match_len = (byte2 & 0b00001111) + MIN_MATCH_SIZE
+                match_pos = ((byte2 & 0b11110000) << 4) | byte1
+                yield input_pos, match_len, (match_pos - DICTIONARY_START_POS - input_pos) % DICTIONARY_SIZE, flag_cnt, group_pos
+                input_pos += match_len
+                encoded_pos += 2
+
+
+def common_prefix_size(a, b, block_size=4096):
+    size = min(len(a), len(b))
+    pos = 0
+    while pos < size and a[pos:pos + block_size] == b[pos:pos + block_size]:
+        pos += block_size
+    pos = min(pos, size)
+    while pos < size and a[pos] == b[pos]:
+        pos += 1
+    return pos
+
+
+def common_suffix_size(a, b, limit, block_size=4096):
+    # Size of the common end of a and b, at most limit bytes
+    count = 0
+    while count + block_size <= limit and a[len(a) - count - block_size:len(a) - count] == b[len(b) - count - block_size:len(b) - count]:
+        count += block_size
+    while count < limit and a[len(a) - count - 1] == b[len(b) - count - 1]:
+        count += 1
+    return count
+
+
+def lzss_reencode(old_input, old_encoded, new_input, max_ratio=False, parser=DEFAULT_PARSER, engine=DEFAULT_ENCODER_ENGINE):
+    # Same output as lzss_encode(new_input), reusing old_encoded, the lzss_encode() output of old_input with the same settings
+    #
+    # An operation at input position p only depends on the input up to p + MAX_MATCH_SIZE (one more byte for the lazy
+    # parser) and on the dictionary, so every flag group that ends before that horizon reaches the first changed byte is
+    # copied as is and the encoding resumes from there.
+    # If the end of the input is unchanged and kept the same ring alignment (the length didn't change, or changed by a
+    # multiple of DICTIONARY_SIZE), the dictionary is the same again once a whole dictionary of unchanged input was seen.
+    # From there, as soon as an operation starts where one of the old stream did, every following operation is the same
+    # as in the old stream: they are taken from it without any match search, and the rest of old_encoded is copied as is
+    # once both streams are at the start of a flag group.
+    #
+    # With the c engine and the greedy parser, the parts encoded again use the compiled search, and a parse that hasn't
+    # met the old stream, or whose old operations don't line up with its flag groups again, within REENCODE_RESYNC_LIMIT
+    # bytes is left to lzss_encode_c() for the rest of the input.
+    if parser not in STREAMING_PARSERS:
+        raise ValueError(f"Parser '{parser}' can't resume an encoding, expected one of: {', '.join(STREAMING_PARSERS)}")
+    if engine not in ("hashchain", "c"):
+        raise ValueError("Resuming an encoding needs the hashchain or c engine")
+    compiled = engine == "c" and parser in C_PARSERS
+    if compiled and lzss_accel is None:
+        raise ImportError("The 'c' encoder engine requires the lzss_accel extension, build it with: python setup.py build_ext --inplace")
+
+    old_size = len(old_input)
+    new_size = len(new_input)
+
+    first_diff = common_prefix_size(old_input, new_input)
+    if first_diff == old_size == new_size:
+        return bytearray(old_encoded)
+    common_suffix = common_suffix_size(old_input, new_input, min(old_size, new_size) - first_diff)
+
+    shift = new_size - old_size
+    resync_pos = new_size - common_suffix + DICTIONARY_SIZE
+    can_resync = common_suffix > 0 and shift % DICTIONARY_SIZE == 0 and resync_pos < new_size
+
+    # Reuse the groups that only depend on the common prefix, and find the group the old operations are taken from
+    resume_pos, resume_encoded_pos = 0, 0
+    resync_group = (0, 0)
+    for input_pos, encoded_pos in iter_flag_groups(old_encoded):
+        if input_pos + MAX_MATCH_SIZE + 1 <= first_diff:
+            resume_pos, resume_encoded_pos = input_pos, encoded_pos
+        if not can_resync or input_pos > resync_pos - shift:
+            break
+        resync_group = (input_pos, encoded_pos)
+
+    encoded_output = bytearray(old_encoded[:resume_encoded_pos])
+    encoder_format = get_encoder_format(CMPS_PROFILE, max_ratio)
+
+    if compiled and not can_resync:
+        # resume_pos starts a flag group of the old stream
+        encoded_output += lzss_encode_c(new_input, encoder_format, input_pos=resume_pos)[0]
+        return encoded_output
+
+    match_finder = encoder_format.match_finder("hashchain", new_input)
+    match_finder.skip_to(resume_pos)
+    packer = OperationPacker(encoder_format)
+    packer.input_pos = resume_pos
+    parse = PARSERS[parser]
+
+    if not can_resync:
+        packer.pack(parse(match_finder, new_size, resume_pos), new_input, encoded_output)
+        packer.flush(encoded_output)
+        return encoded_output
+
+    # Encode up to the point where the dictionary only holds unchanged input
+    if compiled:
+        match_lengths, match_addrs = parse_greedy_c(new_input, resume_pos, resync_pos, encoder_format)
+        packer.pack(zip(match_lengths, array("H", match_addrs)), new_input, encoded_output)
+        match_finder.skip_to(packer.input_pos)
+    else:
+        packer.pack(parse(match_finder, new_size, resume_pos, resync_pos), new_input, encoded_output)
+
+    # Then one operation at a time until one starts where an old one did
+    old_operations = iter_operations(old_encoded, *resync_group)
+    old_operation = next(old_operations, None)
+    resync_limit = packer.input_pos + REENCODE_RESYNC_LIMIT
+    while packer.input_pos < new_size:
+        while old_operation is not None and old_operation[0] < packer.input_pos - shift:
+            old_operation = next(old_operations, None)
+        if old_operation is not None and old_operation[0] == packer.input_pos - shift:
+            break
+        if compiled and packer.input_pos >= resync_limit and packer.flag_cnt == 0:
+            encoded_output += lzss_encode_c(new_input, encoder_format, input_pos=packer.input_pos)[0]
+            return encoded_output
+        packer.pack(parse(match_finder, new_size, packer.input_pos, packer.input_pos + 1), new_input, encoded_output)
+    else:
+        # Reached the end of the input without meeting the old stream
+        packer.flush(encoded_output)
+        return encoded_output
+
+    # The rest are the old operations
+    resync_limit = packer.input_pos + REENCODE_RESYNC_LIMIT
+    while old_operation is not None:
+        _, match_len, match_addr, flag_cnt, group_pos = old_operation
+        if packer.flag_cnt == 0 and flag_cnt == 0:
+            encoded_output += old_encoded[group_pos:]
+            return encoded_output
+        if compiled and packer.input_pos >= resync_limit and packer.flag_cnt == 0:
+            encoded_output += lzss_encode_c(new_input, encoder_format, input_pos=packer.input_pos)[0]
+            return encoded_output
+        packer.pack([(match_len, match_addr)], new_input, encoded_output)
+        old_operation = next(old_operations, None)
+
+    packer.flush(encoded_output)
     return encoded_output
 
 
@@ -210,20 +1093,10 @@ def encode_lzss_file(input_file, output_file):
     with open(input_file, "rb") as file:
         input_data = file.read()
 
-    # Compress the data
-    encoded_data = lzss_encode(input_data)
+    # Compress the data into an LZSS container, see profiles.LZSS_PROFILE
+    encoded_data = container_encode(input_data, profile=LZSS_PROFILE)
 
-    # Write the output to the output file
-    # In first 8 bytes it writes:
-    #   0-3: "LZSS"
-    #   4-7: Size of compressed data in big endian
-    # The resto of the file is the compressed data
     with open(output_file, "wb") as file:
-        file.write(b"LZSS")
-        size = len(input_data) & 0xFFFFFFFF
-
-        file.write(size.to_bytes(4, byteorder='big'))
-
         file.write(encoded_data)
 
 
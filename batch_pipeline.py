@@ -0,0 +1,159 @@
+import os
+import time
+import asyncio
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from LZSS_encoder import lzss_encode
+from LZSS_decoder import container_decode, DEFAULT_DECODER_ENGINE
+from helpers import cmps_header
+from profiles import PROFILES, MAX_HEADER_SIZE, header_file_type
+from codec_stats import CodecStats
+
+DEFAULT_PIPELINE_MEMORY = 256 * 1024 * 1024
+DEFAULT_IO_TASKS = 4
+
+
+# ABOUT THE PIPELINE
+#
+# Batch runs normally have every worker process read its file, compress or decompress it and write the result, so a
+# worker waiting on a slow (network) disk leaves its core idle. Here the files go through three stages instead:
+#   - reader tasks read the files in threads, as far ahead as the memory budget allows
+#   - one coder task per worker process sends the data to the process pool, which only does the coding
+#   - writer tasks write the results in threads
+# The stages are joined by bounded queues, and the bytes of every file held between being read and being written count
+# against the budget, so memory stays bounded whatever the speed of each stage.
+
+
+class ByteBudget:
+    # Waits in acquire() while more than limit bytes are held, a single item larger than the limit still gets through
+    # once nothing else is held
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.condition = asyncio.Condition()
+
+    async def acquire(self, size):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.used == 0 or self.used + size <= self.limit)
+            self.used += size
+
+    async def add(self, size):
+        # Hold more bytes without waiting, for data that already exists
+        async with self.condition:
+            self.used += size
+
+    async def release(self, size):
+        async with self.condition:
+            self.used -= size
+            self.condition.notify_all()
+
+    async def adjust(self, delta):
+        # Resize a reservation without waiting, once the real size of what it was made for is known
+        async with self.condition:
+            self.used += delta
+            if delta < 0:
+                self.condition.notify_all()
+
+
+def read_input(path):
+    # Returns the file type and the whole file, or only its header when it isn't a compressed or FJF file
+    with open(path, "rb") as file:
+        header = file.read(MAX_HEADER_SIZE)
+        file_type = header_file_type(header)
+        if file_type is None:
+            return file_type, header
+        return file_type, header + file.read()
+
+
+def write_output(path, data):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(data)
+
+
+def code_data(data, file_type, engine, max_ratio, parser, collect_stats, decoder=DEFAULT_DECODER_ENGINE, max_chain_length=0,
+              skip_incompressible=False):
+    # Runs in a worker process: decompress data of any of PROFILES or compress FJF data
+    # Returns (status, output, seconds, stats), stats being CodecStats.as_dict() with collect_stats and None otherwise
+    start = time.perf_counter()
+    stats = CodecStats() if collect_stats else None
+    if file_type in PROFILES:
+        status, output = "decompressed", container_decode(data, decoder, stats, PROFILES[file_type])
+    else:
+        status, output = "recompressed", cmps_header(len(data)) + lzss_encode(data, engine, max_ratio, parser, stats, max_chain_length=max_chain_length,
+                                                                              skip_incompressible=skip_incompressible)
+    return status, output, time.perf_counter() - start, stats and stats.as_dict()
+
+
+async def run_pipeline(jobs, options, on_result, workers=None, memory=DEFAULT_PIPELINE_MEMORY, io_tasks=DEFAULT_IO_TASKS):
+    # Process the (input file, output file) pairs, options being (engine, max_ratio, parser, collect_stats, decoder,
+    # max_chain_length, skip_incompressible)
+    # on_result(input file, output file, result) is called as files are written, with a result like process_file()
+    loop = asyncio.get_running_loop()
+    workers = workers or os.cpu_count() or 1
+    budget = ByteBudget(memory)
+    read_queue = asyncio.Queue(workers)
+    write_queue = asyncio.Queue(workers)
+    pending = iter(jobs)  # Shared by the readers
+
+    async def reader():
+        for inpath, outpath in pending:
+            start = time.perf_counter()
+            try:
+                size = await asyncio.to_thread(os.path.getsize, inpath)
+                await budget.acquire(size)
+                try:
+                    file_type, data = await asyncio.to_thread(read_input, inpath)
+                except OSError:
+                    await budget.release(size)
+                    raise
+                # The file may have changed size since, or be only a header
+                await budget.adjust(len(data) - size)
+            except OSError as e:
+                on_result(inpath, outpath, ("error", 0, 0, time.perf_counter() - start, f"{type(e).__name__}: {e}", None, None))
+                continue
+            await read_queue.put((inpath, outpath, time.perf_counter() - start, file_type, data))
+
+    async def coder(executor):
+        while (item := await read_queue.get()) is not None:
+            inpath, outpath, seconds, file_type, data = item
+            output = None
+            stats = None
+            message = ""
+            if file_type is None:
+                status, message = "skipped", "This file is not compressed."
+            else:
+                try:
+                    status, output, coding_seconds, stats = await loop.run_in_executor(executor, code_data, data, file_type, *options)
+                    seconds += coding_seconds
+                    await budget.add(len(output))
+                except Exception as e:
+                    status, message = "error", f"{type(e).__name__}: {e}"
+            await budget.release(len(data))
+            await write_queue.put((inpath, outpath, seconds, status, len(data), output, message, stats))
+
+    async def writer():
+        while (item := await write_queue.get()) is not None:
+            inpath, outpath, seconds, status, input_size, output, message, stats = item
+            output_size = 0
+            if output is not None:
+                start = time.perf_counter()
+                try:
+                    await asyncio.to_thread(write_output, outpath, output)
+                    output_size = len(output)
+                except OSError as e:
+                    status, message, stats = "error", f"{type(e).__name__}: {e}", None
+                seconds += time.perf_counter() - start
+                await budget.release(len(output))
+            on_result(inpath, outpath, (status, input_size, output_size, seconds, message, None, stats))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        coders = [asyncio.create_task(coder(executor)) for _ in range(workers)]
+        writers = [asyncio.create_task(writer()) for _ in range(io_tasks)]
+        await asyncio.gather(*(reader() for _ in range(io_tasks)))
+        for _ in coders:
+            await read_queue.put(None)
+        await asyncio.gather(*coders)
+        for _ in writers:
+            await write_queue.put(None)
+        await asyncio.gather(*writers)
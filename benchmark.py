@@ -0,0 +1,259 @@
+#! /usr/bin/env python3
+# Benchmark of the LZSS encoder and decoder on generated data with the CMPS settings
+#
+# Every case runs in a fresh process so its peak RSS can be measured. Results can be saved as JSON and compared against a
+# baseline saved earlier, the script then exits with 1 if a case got slower or compresses worse than the tolerance allows.
+#
+#   python benchmark.py --sizes 1K,64K,1M --output results.json
+#   python benchmark.py --sizes 1K,64K,1M --baseline results.json
+#   python benchmark.py --levels all
+
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from LZSS_encoder import lzss_encode, encoder_level, ENCODER_ENGINES, ENCODER_LEVELS, DEFAULT_ENCODER_ENGINE
+from LZSS_decoder import lzss_decode, DECODER_ENGINES, DEFAULT_DECODER_ENGINE
+from helpers import cmps_lzss_config
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_SIZES = "1K,64K,1M"
+ALL_SIZES = "1K,16K,256K,4M,32M"
+DEFAULT_TOLERANCE = 0.10
+
+TEXT_WORDS = [
+    b"Seiya", b"Shiryu", b"Hyoga", b"Shun", b"Ikki", b"Athena", b"Saori", b"Pegasus", b"Dragon", b"Cygnus",
+    b"Andromeda", b"Phoenix", b"Sanctuary", b"Gold", b"Saint", b"Cosmo", b"the", b"of", b"and", b"to", b"a", b"is",
+    b"you", b"my", b"your", b"will", b"not", b"must", b"fight", b"burn", b"power", b"!", b"?", b"...", b",", b".",
+]
+
+
+def make_random(size, rng):
+    return rng.randbytes(size)
+
+
+def make_repetitive(size, rng):
+    # A short pattern repeated over and over with a few random changes
+    data = bytearray((rng.randbytes(rng.randrange(8, 64)) * (size // 8 + 1))[:size])
+    for _ in range(size // 512):
+        data[rng.randrange(size)] = rng.randrange(256)
+    return bytes(data)
+
+
+def make_texture(size, rng):
+    # 8-bit palettized 256x256 tiles: smooth gradients with noise and flat areas, each tile using shifted palette indices
+    tile = bytearray(256 * 256)
+    for y in range(256):
+        row_base = (y * 3 // 4) & 0xFF
+        value = row_base
+        for x in range(256):
+            if rng.random() < 0.3:
+                value = (row_base + (x >> 2) + rng.randrange(-2, 3)) & 0xFF
+            tile[y * 256 + x] = value
+    tile = bytes(tile)
+
+    data = bytearray()
+    while len(data) < size:
+        shift = rng.randrange(256)
+        data += tile.translate(bytes((i + shift) & 0xFF for i in range(256)))
+    return bytes(data[:size])
+
+
+def make_text(size, rng):
+    # Game script like text: words, spaces, line breaks and null terminated strings
+    words = rng.choices(TEXT_WORDS, k=size // 4 + 16)
+    separators = rng.choices([b" ", b" ", b" ", b" ", b"\n", b"\x00"], k=len(words))
+    data = b"".join(word + separator for word, separator in zip(words, separators))
+    return data[:size]
+
+
+CORPORA = {
+    "random": make_random,
+    "repetitive": make_repetitive,
+    "texture": make_texture,
+    "text": make_text,
+}
+
+
+def parse_size(text):
+    units = {"K": 1024, "M": 1024 * 1024}
+    text = text.strip().upper()
+    if text[-1:] in units:
+        return int(text[:-1]) * units[text[-1]]
+    return int(text)
+
+
+def format_size(size):
+    if size % (1024 * 1024) == 0:
+        return f"{size // (1024 * 1024)}M"
+    if size % 1024 == 0:
+        return f"{size // 1024}K"
+    return str(size)
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak  # bytes on macOS, KiB elsewhere
+
+
+def best_time(repeat, function, *args):
+    # Returns (result, fastest time) of repeat calls
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return result, best
+
+
+def run_case(corpus, size, engine, decoder, repeat=1, level=None):
+    # Runs in its own process: generate the data, encode, decode and check the round trip
+    # level is one of the LZSS_encoder.ENCODER_LEVELS, None for the default settings
+    data = CORPORA[corpus](size, random.Random(f"{corpus}:{size}"))
+    lzss_config = cmps_lzss_config()
+    options = encoder_level(level) if level is not None else {}
+
+    encoded, encode_seconds = best_time(repeat, lambda: lzss_encode(data, engine, **options))
+    decoded, decode_seconds = best_time(repeat, lzss_decode, lzss_config, encoded, decoder)
+
+    return {
+        "corpus": corpus,
+        "size": size,
+        "engine": engine,
+        "level": level,
+        "decoder": decoder,
+        "compressed_size": len(encoded),
+        "ratio": len(encoded) / size if size else 1.0,
+        "encode_seconds": encode_seconds,
+        "encode_mb_s": size / encode_seconds / 1e6 if encode_seconds > 0 else 0.0,
+        "decode_seconds": decode_seconds,
+        "decode_mb_s": size / decode_seconds / 1e6 if decode_seconds > 0 else 0.0,
+        "peak_rss_kb": peak_rss_kb(),
+        "roundtrip_ok": decoded == data,
+    }
+
+
+def case_key(result):
+    # Results of the default settings keep the key they had before the levels existed
+    level = result.get("level")
+    engine = result["engine"] if level is None else f"{result['engine']}/L{level}"
+    return f"{result['corpus']}/{format_size(result['size'])}/{engine}/{result['decoder']}"
+
+
+def run_benchmark(corpora, sizes, engines, decoders, repeat=1, levels=(None,)):
+    results = []
+    # A fresh process per case, started from scratch so the peak RSS isn't inherited from this one
+    context = multiprocessing.get_context("spawn")
+    for corpus in corpora:
+        for size in sizes:
+            for engine in engines:
+                for level in levels:
+                    for decoder in decoders:
+                        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                            result = executor.submit(run_case, corpus, size, engine, decoder, repeat, level).result()
+                        print_result(result)
+                        results.append(result)
+    return results
+
+
+def print_header():
+    print(f"{'case':<44} {'ratio':>7} {'enc MB/s':>9} {'dec MB/s':>9} {'peak RSS':>10}  ok")
+
+
+def print_result(result):
+    rss = f"{result['peak_rss_kb'] // 1024} MiB" if result["peak_rss_kb"] is not None else "n/a"
+    print(f"{case_key(result):<44} {result['ratio']:>7.3f} {result['encode_mb_s']:>9.3f} {result['decode_mb_s']:>9.3f} {rss:>10}  "
+          f"{'yes' if result['roundtrip_ok'] else 'NO'}", flush=True)
+
+
+def compare_with_baseline(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    # Returns the list of regressions found against the baseline results
+    baseline_cases = {case_key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = baseline_cases.get(case_key(result))
+        if old is None:
+            continue
+        name = case_key(result)
+        if not result["roundtrip_ok"]:
+            regressions.append(f"{name}: round trip failed")
+        for field in ("encode_mb_s", "decode_mb_s"):
+            if old[field] > 0 and result[field] < old[field] * (1 - tolerance):
+                regressions.append(f"{name}: {field} {old[field]:.3f} -> {result[field]:.3f}")
+        # Same input and settings, so any change of the ratio comes from the encoder
+        if result["ratio"] > old["ratio"]:
+            regressions.append(f"{name}: ratio {old['ratio']:.4f} -> {result['ratio']:.4f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the LZSS encoder and decoder")
+    parser.add_argument("--sizes", type=str, default=DEFAULT_SIZES, help=f"Comma separated input sizes, K and M suffixes allowed. Default: {DEFAULT_SIZES}, all of them: {ALL_SIZES}")
+    parser.add_argument("--corpora", type=str, default=",".join(CORPORA), help="Comma separated generated corpora: " + ", ".join(CORPORA))
+    parser.add_argument("--engines", type=str, default=DEFAULT_ENCODER_ENGINE, help="Comma separated encoder engines: " + ", ".join(ENCODER_ENGINES))
+    parser.add_argument("--levels", type=str, default="", help="Comma separated compression levels to run instead of the default settings, 'default' for those and 'all' for every level: " + ", ".join(map(str, ENCODER_LEVELS)))
+    parser.add_argument("--decoders", type=str, default=DEFAULT_DECODER_ENGINE, help="Comma separated decoder engines: " + ", ".join(DECODER_ENGINES))
+    parser.add_argument("--repeat", type=int, default=3, help="Times every case is run, the fastest one is kept. Default: 3")
+    parser.add_argument("--output", type=str, default="", help="Save the results to this JSON file")
+    parser.add_argument("--baseline", type=str, default="", help="Compare the results with this JSON file saved earlier")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Allowed slowdown against the baseline, 0.1 is 10%%")
+    args = parser.parse_args()
+
+    sizes = [parse_size(size) for size in args.sizes.split(",")]
+    corpora = args.corpora.split(",")
+    engines = args.engines.split(",")
+    decoders = args.decoders.split(",")
+    level_names = args.levels.split(",") if args.levels else ["default"]
+    if level_names == ["all"]:
+        level_names = ["default"] + [str(level) for level in ENCODER_LEVELS]
+    levels = []
+    for name in level_names:
+        if name != "default" and (not name.isdigit() or int(name) not in ENCODER_LEVELS):
+            parser.error(f"Unknown level '{name}', expected default, all or one of: {', '.join(map(str, ENCODER_LEVELS))}")
+        levels.append(None if name == "default" else int(name))
+    if any(level is not None for level in levels) and any(engine not in ("hashchain", "c") for engine in engines):
+        parser.error("The levels need the hashchain or c engine")
+    for name, choices in (("corpus", CORPORA), ("engine", ENCODER_ENGINES), ("decoder", DECODER_ENGINES)):
+        selected = {"corpus": corpora, "engine": engines, "decoder": decoders}[name]
+        for value in selected:
+            if value not in choices:
+                parser.error(f"Unknown {name} '{value}', expected one of: {', '.join(choices)}")
+
+    print_header()
+    results = run_benchmark(corpora, sizes, engines, decoders, max(1, args.repeat), levels)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(), "results": results}, f, indent=2)
+        print(f"Results saved to {args.output}")
+
+    failed = [case_key(result) for result in results if not result["roundtrip_ok"]]
+    for name in failed:
+        print(f"[ERROR] {name}: decoded data differs from the input")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"[REGRESSION] {regression}")
+        if not regressions:
+            print(f"No regression against {args.baseline}")
+        failed += regressions
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,128 @@
+import os
+import zlib
+import bisect
+import struct
+from LZSS_decoder import ContainerReader, Checkpoint, initial_checkpoint, decode_from_checkpoint
+from helpers import map_file
+from profiles import container_profile
+
+CHECKPOINT_INDEX_MAGIC = b"CMPI"
+CHECKPOINT_INDEX_VERSION = 1
+CHECKPOINT_INDEX_SUFFIX = ".cpi"
+DEFAULT_CHECKPOINT_INTERVAL = 64 * 1024
+
+# Magic, version, interval, dictionary size, size and modification time of the compressed file, number of checkpoints
+INDEX_HEADER = struct.Struct("<4sBIIQqI")
+# Compressed position (after the container header) and decompressed position, followed by the dictionary
+CHECKPOINT_HEADER = struct.Struct("<II")
+
+
+class CheckpointIndex:
+    # Decoder checkpoints of a compressed file (CMPS or any other format profile), about every interval bytes of decompressed data
+    #
+    # read_range() starts from the last checkpoint before the requested offset, so reading a part of the file only decodes
+    # that part plus less than one interval. The index is saved next to the file as <file>.cpi, zlib compressed, along
+    # with the size and modification time of the file so that an index of an older version of it is never used.
+    def __init__(self, interval, source_size, source_mtime_ns, checkpoints):
+        self.interval = interval
+        self.source_size = source_size
+        self.source_mtime_ns = source_mtime_ns
+        self.checkpoints = checkpoints
+        self.positions = [checkpoint.decompressed_pos for checkpoint in checkpoints]
+
+    @classmethod
+    def for_file(cls, path, interval, checkpoints):
+        stat = os.stat(path)
+        return cls(interval, stat.st_size, stat.st_mtime_ns, checkpoints)
+
+    def matches(self, path):
+        stat = os.stat(path)
+        return stat.st_size == self.source_size and stat.st_mtime_ns == self.source_mtime_ns
+
+    def find(self, offset):
+        # Last checkpoint at or before decompressed offset
+        return self.checkpoints[bisect.bisect_right(self.positions, offset) - 1]
+
+    def save(self, index_file):
+        body = bytearray()
+        for checkpoint in self.checkpoints:
+            body += CHECKPOINT_HEADER.pack(checkpoint.compressed_pos, checkpoint.decompressed_pos)
+            body += checkpoint.dictionary
+        dictionary_size = len(self.checkpoints[0].dictionary)
+        with open(index_file, "wb") as f:
+            f.write(INDEX_HEADER.pack(CHECKPOINT_INDEX_MAGIC, CHECKPOINT_INDEX_VERSION, self.interval, dictionary_size,
+                                      self.source_size, self.source_mtime_ns, len(self.checkpoints)))
+            f.write(zlib.compress(body))
+
+    @classmethod
+    def load(cls, index_file):
+        with open(index_file, "rb") as f:
+            data = f.read()
+        if len(data) < INDEX_HEADER.size:
+            raise ValueError(f"{index_file} is not a checkpoint index")
+        magic, version, interval, dictionary_size, source_size, source_mtime_ns, count = INDEX_HEADER.unpack_from(data)
+        if magic != CHECKPOINT_INDEX_MAGIC or version != CHECKPOINT_INDEX_VERSION:
+            raise ValueError(f"{index_file} is not a checkpoint index of version {CHECKPOINT_INDEX_VERSION}")
+
+        body = zlib.decompress(data[INDEX_HEADER.size:])
+        entry_size = CHECKPOINT_HEADER.size + dictionary_size
+        if len(body) != count * entry_size:
+            raise ValueError(f"{index_file} is truncated")
+        checkpoints = []
+        for pos in range(0, len(body), entry_size):
+            compressed_pos, decompressed_pos = CHECKPOINT_HEADER.unpack_from(body, pos)
+            checkpoints.append(Checkpoint(compressed_pos, decompressed_pos, body[pos + CHECKPOINT_HEADER.size:pos + entry_size]))
+        return cls(interval, source_size, source_mtime_ns, checkpoints)
+
+
+def index_path(path):
+    return str(path) + CHECKPOINT_INDEX_SUFFIX
+
+
+def build_checkpoint_index(path, interval=DEFAULT_CHECKPOINT_INTERVAL):
+    # Decode the whole compressed file once, keeping only the checkpoints
+    with map_file(path) as data:
+        profile = container_profile(data)
+        checkpoints = [initial_checkpoint(profile.lzss_config)]
+        with ContainerReader(data, interval, checkpoints, profile) as reader:
+            while reader.read(interval):
+                pass
+    return CheckpointIndex.for_file(path, interval, checkpoints)
+
+
+def load_checkpoint_index(path, interval=DEFAULT_CHECKPOINT_INTERVAL):
+    # The index saved next to path if it is up to date, otherwise a new one, saved there when the folder is writable
+    index_file = index_path(path)
+    try:
+        index = CheckpointIndex.load(index_file)
+        if index.matches(path):
+            return index
+    except (OSError, ValueError, zlib.error):
+        pass
+
+    index = build_checkpoint_index(path, interval)
+    try:
+        index.save(index_file)
+    except OSError:
+        pass
+    return index
+
+
+def read_range(path, offset, length, index=None):
+    # Up to length bytes of the decompressed content of the compressed file path, starting at offset
+    # Only the data from the checkpoint before offset is decoded, the index is loaded (or built) if not given
+    if offset < 0 or length < 0:
+        raise ValueError("offset and length can't be negative")
+    if index is None:
+        index = load_checkpoint_index(path)
+
+    checkpoint = index.find(offset)
+    with map_file(path) as data:
+        profile = container_profile(data)
+        uncompressed_size = profile.read_header(data)
+        length = max(0, min(length, uncompressed_size - offset))
+        if length == 0:
+            return b""
+        with memoryview(data)[profile.header_size:] as compressed_data:
+            decoded = decode_from_checkpoint(profile.lzss_config, compressed_data, checkpoint, offset - checkpoint.decompressed_pos + length)
+    return decoded[offset - checkpoint.decompressed_pos:]
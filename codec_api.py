@@ -0,0 +1,267 @@
+import os
+import glob
+import time
+import shutil
+from pathlib import Path
+from LZSS_decoder import (
+    ContainerReader, container_decode, initial_checkpoint, DEFAULT_CHUNK_SIZE, DEFAULT_DECODER_ENGINE, MAX_WHOLE_DECODE_SIZE,
+)
+from LZSS_encoder import (
+    CmpsWriter, lzss_encode, lzss_reencode, container_encode, encoder_level, C_PARSERS, DEFAULT_ENCODER_ENGINE, DEFAULT_PARSER,
+    STREAMING_PARSERS,
+)
+from helpers import CMPS_MAGIC, CMPS_HEADER_SIZE, cmps_header, cmps_lzss_config, map_file, replace_file
+from profiles import PROFILES, CMPS_PROFILE, MAX_HEADER_SIZE, container_profile, header_file_type
+from codec_stats import CodecStats
+from checkpoint_index import CheckpointIndex, build_checkpoint_index, index_path, DEFAULT_CHECKPOINT_INTERVAL
+
+# ABOUT THE LIBRARY API
+#
+# Everything saintseiyaBIN.py does is available from here without its command line, so a long running process can
+# import this module once and compress or decompress any number of files in-process:
+#
+#   import codec_api
+#   content = codec_api.decompress("FILE.BIN")            # a path or the compressed bytes themselves
+#   data = codec_api.compress(content, level=1)           # a whole CMPS file, header included
+#   for inpath, outpath, result in codec_api.iter_batch_results(codec_api.collect_batch_files(["extracted"], "output"),
+#                                                               in_process=True, max_ratio=True):
+#       ...
+#
+# Importing it only loads the codecs. The worker pool, the segmented encoder and NumPy are imported the first time they
+# are used, and the compiled lzss_accel extension is used by default whenever it is built.
+
+
+def is_path(source):
+    return isinstance(source, (str, os.PathLike))
+
+
+def decompress(source, decoder=DEFAULT_DECODER_ENGINE, stats=None):
+    # Content of a compressed file of any of PROFILES, source being its path or its data
+    if is_path(source):
+        with map_file(source) as data:
+            return container_decode(data, decoder, stats)
+    return container_decode(source, decoder, stats)
+
+
+def compress(source, level=None, engine=DEFAULT_ENCODER_ENGINE, max_ratio=False, parser=DEFAULT_PARSER, profile=CMPS_PROFILE, stats=None,
+             max_chain_length=0, skip_incompressible=False):
+    # A whole compressed file (header included) of source, its path or the data itself. With the default settings the
+    # output is identical to the files of the game, level sets max_ratio, parser and max_chain_length instead, see
+    # LZSS_encoder.ENCODER_LEVELS. The other arguments are those of LZSS_encoder.lzss_encode().
+    if level is not None:
+        if max_ratio or parser != DEFAULT_PARSER or max_chain_length:
+            raise ValueError("A level sets the search and the parser, it can't be combined with max_ratio, parser or max_chain_length")
+        settings = encoder_level(level)
+        max_ratio, parser, max_chain_length = settings["max_ratio"], settings["parser"], settings["max_chain_length"]
+    if is_path(source):
+        with map_file(source) as data:
+            return container_encode(data, engine, max_ratio, parser, stats, profile, max_chain_length, skip_incompressible)
+    return container_encode(source, engine, max_ratio, parser, stats, profile, max_chain_length, skip_incompressible)
+
+
+def decode_lzss_file(input_file, output_file, stats=None, save_checkpoints=False, decoder=DEFAULT_DECODER_ENGINE):
+    # Decompress block by block straight from a memory map of the input, only the dictionary and one block of output
+    # are kept in memory
+    # save_checkpoints also writes the checkpoint index of input_file next to it, for checkpoint_index.read_range()
+    # Decoders other than "fast" decode the whole file at once, so they are only used up to MAX_WHOLE_DECODE_SIZE of
+    # output. Checkpoints always use the block by block decoder.
+    # The container (CMPS, LZSS) is found from the magic of the file, see profiles.py
+    # The output replaces output_file once it is complete, which can then be input_file itself. There is no compressed
+    # file left to index in that case, save_checkpoints is ignored.
+    if save_checkpoints and os.path.exists(output_file) and os.path.samefile(input_file, output_file):
+        save_checkpoints = False
+    with map_file(input_file) as input_data, replace_file(output_file) as out:
+        profile = container_profile(input_data)
+        if decoder != "fast" and not save_checkpoints and profile.read_header(input_data) <= MAX_WHOLE_DECODE_SIZE:
+            out.write(container_decode(input_data, decoder, stats, profile))
+            return 0
+
+        checkpoints = [initial_checkpoint(profile.lzss_config)] if save_checkpoints else None
+        with ContainerReader(input_data, DEFAULT_CHECKPOINT_INTERVAL, checkpoints, profile) as reader:
+            if stats is None:
+                shutil.copyfileobj(reader, out, DEFAULT_CHUNK_SIZE)
+            else:
+                with stats.phase("decode"):
+                    shutil.copyfileobj(reader, out, DEFAULT_CHUNK_SIZE)
+        if stats is not None:
+            with memoryview(input_data)[profile.header_size:] as compressed_data:
+                stats.count_operations(profile.lzss_config, compressed_data)
+    if save_checkpoints:
+        CheckpointIndex.for_file(input_file, DEFAULT_CHECKPOINT_INTERVAL, checkpoints).save(index_path(input_file))
+    return 0
+
+
+def encode_lzss_file(input_file, output_file, engine=DEFAULT_ENCODER_ENGINE, max_ratio=False, parser=DEFAULT_PARSER, stats=None, segmented=False, strict=False, workers=None,
+                     max_chain_length=0, skip_incompressible=False):
+    # Write the output to the output file
+    # In first 16 bytes it writes:
+    #   0-3: "CMPS"
+    #   4-7: 0
+    #   8-11: Size of compressed data in little endian
+    #   12-15: 0
+    # The rest of the file is the compressed data
+    # segmented splits the input between worker processes, see segmented_encoder.py
+    # max_chain_length limits the candidates tried per position, see LZSS_encoder.ENCODER_LEVELS
+    # skip_incompressible writes the parts that hardly match as literals without searching them, see lzss_encode()
+    if segmented and skip_incompressible:
+        raise ValueError("The segmented encoding can't skip incompressible data")
+    if segmented and engine != "hashchain":
+        raise ValueError("The segmented encoding runs the hashchain search, with the c engine encode serially instead")
+    # The output replaces output_file once it is complete, which can then be input_file itself
+    with open(input_file, "rb") as file, replace_file(output_file) as out:
+        if segmented:
+            from segmented_encoder import lzss_encode_segmented
+            with map_file(input_file) as input_data:
+                out.write(cmps_header(len(input_data)))
+                if stats is None:
+                    out.write(lzss_encode_segmented(input_data, max_ratio, parser, workers, strict=strict, max_chain_length=max_chain_length))
+                else:
+                    with stats.phase("encode"):
+                        encoded_data = lzss_encode_segmented(input_data, max_ratio, parser, workers, strict=strict, max_chain_length=max_chain_length)
+                    stats.count_operations(cmps_lzss_config(), encoded_data)
+                    out.write(encoded_data)
+        elif parser in STREAMING_PARSERS and (engine == "hashchain" or engine == "c" and parser not in C_PARSERS) and not skip_incompressible:
+            # Compress block by block, the output is written as it is produced
+            size = os.fstat(file.fileno()).st_size
+            with CmpsWriter(out, size, max_ratio, parser, stats, max_chain_length) as writer:
+                shutil.copyfileobj(file, writer, DEFAULT_CHUNK_SIZE)
+        else:
+            # The engines index the input as a whole, it is memory mapped rather than read
+            with map_file(input_file) as input_data:
+                out.write(cmps_header(len(input_data)))
+                out.write(lzss_encode(input_data, engine, max_ratio, parser, stats, max_chain_length=max_chain_length,
+                                      skip_incompressible=skip_incompressible))
+    return 0
+
+
+def detect_file_type(path):
+    # Only the header is needed to tell the files apart
+    with open(path, "rb") as input_file:
+        return header_file_type(input_file.read(MAX_HEADER_SIZE))
+
+
+def reencode_lzss_file(input_file, output_file, previous_input_file, previous_output_file, max_ratio=False, parser=DEFAULT_PARSER, stats=None,
+                       engine=DEFAULT_ENCODER_ENGINE):
+    # Recompress input_file reusing the recompressed previous_output_file of previous_input_file, which must have been
+    # made with the same settings. Only the part around what changed is compressed again.
+    # The three files are memory mapped, only the pages that are compared or encoded again are read.
+    with map_file(previous_input_file) as previous_input, map_file(previous_output_file) as previous_output, map_file(input_file) as input_data:
+        if previous_output[:4] != CMPS_MAGIC:
+            raise ValueError(f"{previous_output_file} is not a CMPS file")
+
+        with memoryview(previous_output)[CMPS_HEADER_SIZE:] as previous_encoded:
+            if stats is None:
+                encoded_data = lzss_reencode(previous_input, previous_encoded, input_data, max_ratio, parser, engine)
+            else:
+                with stats.phase("reencode"):
+                    encoded_data = lzss_reencode(previous_input, previous_encoded, input_data, max_ratio, parser, engine)
+                stats.count_operations(cmps_lzss_config(), encoded_data)
+        input_size = len(input_data)
+
+    with open(output_file, "wb") as out:
+        out.write(cmps_header(input_size))
+        out.write(encoded_data)
+    return 0
+
+
+def encode_lzss_file_cached(input_file, output_file, cache, engine=DEFAULT_ENCODER_ENGINE, max_ratio=False, parser=DEFAULT_PARSER, stats=None, segmented=False, strict=False, workers=None,
+                            max_chain_length=0, skip_incompressible=False):
+    # encode_lzss_file() that first looks for the same input and settings in cache, returns True on a cache hit
+    # Segmented encoding has to be strict, the entries are those of a serial encoding
+    if segmented and not strict:
+        raise ValueError("Only the strict segmented encoding can use the cache")
+    key = cache.key_for_file(input_file, max_ratio, parser, max_chain_length, skip_incompressible)
+    if cache.fetch(key, output_file):
+        return True
+    encode_lzss_file(input_file, output_file, engine, max_ratio, parser, stats, segmented, strict, workers, max_chain_length, skip_incompressible)
+    cache.store(key, output_file)
+    return False
+
+
+def process_file(inpath, outpath, engine=DEFAULT_ENCODER_ENGINE, max_ratio=False, parser=DEFAULT_PARSER, cache=None, collect_stats=False, save_checkpoints=False,
+                 decoder=DEFAULT_DECODER_ENGINE, max_chain_length=0, skip_incompressible=False):
+    # Decompress a compressed file (any of PROFILES) or recompress a FJF one, save_checkpoints writes the checkpoint index
+    # of the compressed file
+    # Returns (status, input size, output size, seconds, message, cache hit, stats), cache hit is None when the cache
+    # wasn't used and stats is CodecStats.as_dict() with collect_stats, None otherwise
+    start = time.perf_counter()
+    input_size = 0
+    cache_hit = None
+    stats = CodecStats() if collect_stats else None
+    try:
+        input_size = os.path.getsize(inpath)
+        file_type = detect_file_type(inpath)
+        if file_type is None:
+            return "skipped", input_size, 0, time.perf_counter() - start, "This file is not compressed.", cache_hit, None
+
+        Path(outpath).parent.mkdir(parents=True, exist_ok=True)
+        if file_type in PROFILES:
+            decode_lzss_file(inpath, outpath, stats, save_checkpoints, decoder)
+            status = "decompressed"
+        else:
+            if cache is not None:
+                cache_hit = encode_lzss_file_cached(inpath, outpath, cache, engine, max_ratio, parser, stats, max_chain_length=max_chain_length,
+                                                    skip_incompressible=skip_incompressible)
+            else:
+                encode_lzss_file(inpath, outpath, engine, max_ratio, parser, stats, max_chain_length=max_chain_length,
+                                 skip_incompressible=skip_incompressible)
+            if save_checkpoints:
+                build_checkpoint_index(outpath).save(index_path(outpath))
+            status = "recompressed"
+        return status, input_size, os.path.getsize(outpath), time.perf_counter() - start, "", cache_hit, stats and stats.as_dict()
+    except Exception as e:
+        return "error", input_size, 0, time.perf_counter() - start, f"{type(e).__name__}: {e}", cache_hit, None
+
+
+def is_glob_pattern(path):
+    return any(c in path for c in "*?[")
+
+
+def collect_input_files(inpaths):
+    # Expand directories (recursively) and glob patterns into (file, base folder) pairs
+    # The base folder is the directory given, or the fixed part of the pattern
+    files = []
+    for inpath in inpaths:
+        if is_glob_pattern(inpath):
+            base_parts = []
+            for part in Path(inpath).parts:
+                if is_glob_pattern(part):
+                    break
+                base_parts.append(part)
+            base = Path(*base_parts) if base_parts else Path(".")
+            paths = [Path(path) for path in sorted(glob.glob(inpath, recursive=True)) if Path(path).is_file()]
+        elif Path(inpath).is_dir():
+            base = Path(inpath)
+            paths = sorted(path for path in base.rglob("*") if path.is_file())
+        elif Path(inpath).is_file():
+            base = Path(inpath).parent
+            paths = [Path(inpath)]
+        else:
+            print(f"[WARNING] {inpath} does not exist")
+            continue
+
+        files += [(path, base) for path in paths]
+    return files
+
+
+def collect_batch_files(inpaths, outpath):
+    # (input file, output file) pairs, output files keep their path relative to the base folder of the input
+    return [(str(path), str(Path(outpath) / path.relative_to(base))) for path, base in collect_input_files(inpaths)]
+
+
+def iter_batch_results(jobs, workers=None, in_process=False, **options):
+    # Yields (input file, output file, result of process_file()) as the files are done, options are the keyword
+    # arguments of process_file() after the file paths
+    # in_process runs everything one file at a time in this process, which is what the profiler can see and what a
+    # resident worker without a pool of its own wants
+    if in_process:
+        for inpath, outpath in jobs:
+            yield inpath, outpath, process_file(inpath, outpath, **options)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(process_file, inpath, outpath, **options): (inpath, outpath) for inpath, outpath in jobs}
+        for future in as_completed(futures):
+            inpath, outpath = futures[future]
+            yield inpath, outpath, future.result()
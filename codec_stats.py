@@ -0,0 +1,148 @@
+import time
+from contextlib import contextmanager
+from LZSS_decoder import flag_is_pointer
+
+
+class CodecStats:
+    # Counters filled by the encoder and decoder when a CodecStats is given to them, nothing is counted otherwise
+    #
+    # Operations are counted from the compressed stream itself, so the numbers are the same whichever engine produced or
+    # read it. Candidates are the dictionary positions a match finder compared against the look-ahead buffer.
+    def __init__(self):
+        self.literals = 0
+        self.pointers = 0
+        self.match_lengths = {}  # Match length -> number of pointers
+        self.uncompressed_bytes = 0
+        self.compressed_bytes = 0
+        self.positions_searched = 0
+        self.candidates_scanned = 0
+        self.literal_run_bytes = 0  # Input bytes written as literals without searching, see LZSS_encoder.LITERAL_RUN_SAMPLE_SIZE
+        self.literal_run_seconds_saved = 0.0
+        self.phase_seconds = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds):
+        self.phase_seconds[name] = self.phase_seconds.get(name, 0.0) + seconds
+
+    def count_operations(self, lzss_config, compressed_data):
+        # Walk the flag groups of compressed_data the same way the decoders do, without decoding anything
+        flag_table = [tuple(bool(flag_is_pointer(flags_byte, flag_index, lzss_config)) for flag_index in range(8))
+                      for flags_byte in range(256)]
+        length_mask = (1 << lzss_config.length_bit_size) - 1
+        min_match_size = lzss_config.min_match_size
+        match_lengths = self.match_lengths
+
+        data = compressed_data
+        data_size = len(data)
+        pos = 0
+        literals = 0
+        pointers = 0
+        uncompressed_bytes = 0
+        while pos < data_size:
+            flags_byte = data[pos]
+            pos += 1
+            for is_pointer in flag_table[flags_byte]:
+                if is_pointer:
+                    if pos + 2 > data_size:
+                        pos = data_size
+                        break
+                    length = (data[pos + 1] & length_mask) + min_match_size
+                    match_lengths[length] = match_lengths.get(length, 0) + 1
+                    pointers += 1
+                    uncompressed_bytes += length
+                    pos += 2
+                else:
+                    if pos >= data_size:
+                        break
+                    literals += 1
+                    uncompressed_bytes += 1
+                    pos += 1
+
+        self.literals += literals
+        self.pointers += pointers
+        self.uncompressed_bytes += uncompressed_bytes
+        self.compressed_bytes += data_size
+
+    def add_match_finder(self, match_finder):
+        self.positions_searched += match_finder.positions_searched
+        self.candidates_scanned += match_finder.candidates_scanned
+
+    def add_literal_runs(self, literal_run_size, seconds_saved=0.0):
+        # seconds_saved is the estimated search time of the literal runs, only the Python engines time their search
+        self.literal_run_bytes += literal_run_size
+        self.literal_run_seconds_saved += seconds_saved
+
+    def merge(self, other):
+        self.literals += other.literals
+        self.pointers += other.pointers
+        for length, count in other.match_lengths.items():
+            self.match_lengths[length] = self.match_lengths.get(length, 0) + count
+        self.uncompressed_bytes += other.uncompressed_bytes
+        self.compressed_bytes += other.compressed_bytes
+        self.positions_searched += other.positions_searched
+        self.candidates_scanned += other.candidates_scanned
+        self.literal_run_bytes += other.literal_run_bytes
+        self.literal_run_seconds_saved += other.literal_run_seconds_saved
+        for name, seconds in other.phase_seconds.items():
+            self.add_time(name, seconds)
+
+    def as_dict(self):
+        return {
+            "literals": self.literals,
+            "pointers": self.pointers,
+            "match_lengths": dict(sorted(self.match_lengths.items())),
+            "uncompressed_bytes": self.uncompressed_bytes,
+            "compressed_bytes": self.compressed_bytes,
+            "positions_searched": self.positions_searched,
+            "candidates_scanned": self.candidates_scanned,
+            "average_candidates": self.candidates_scanned / self.positions_searched if self.positions_searched else 0.0,
+            "literal_run_bytes": self.literal_run_bytes,
+            "literal_run_seconds_saved": self.literal_run_seconds_saved,
+            "phase_seconds": dict(self.phase_seconds),
+        }
+
+    @classmethod
+    def from_dict(cls, values):
+        stats = cls()
+        stats.literals = values["literals"]
+        stats.pointers = values["pointers"]
+        stats.match_lengths = {int(length): count for length, count in values["match_lengths"].items()}
+        stats.uncompressed_bytes = values["uncompressed_bytes"]
+        stats.compressed_bytes = values["compressed_bytes"]
+        stats.positions_searched = values["positions_searched"]
+        stats.candidates_scanned = values["candidates_scanned"]
+        stats.literal_run_bytes = values["literal_run_bytes"]
+        stats.literal_run_seconds_saved = values["literal_run_seconds_saved"]
+        stats.phase_seconds = dict(values["phase_seconds"])
+        return stats
+
+    def report(self):
+        operations = self.literals + self.pointers
+        ratio = self.compressed_bytes / self.uncompressed_bytes if self.uncompressed_bytes else 1.0
+        lines = [
+            f"Sizes:      {self.uncompressed_bytes} bytes uncompressed, {self.compressed_bytes} bytes compressed (ratio {ratio:.3f})",
+            f"Operations: {self.literals} literals, {self.pointers} pointers"
+            + (f" ({100 * self.pointers / operations:.1f}% pointers)" if operations else ""),
+        ]
+        if self.positions_searched:
+            lines.append(f"Search:     {self.positions_searched} positions, "
+                         f"{self.candidates_scanned / self.positions_searched:.1f} candidates scanned per position")
+        if self.literal_run_bytes:
+            lines.append(f"Skipped:    {self.literal_run_bytes} bytes written as literal runs without searching"
+                         + (f", about {self.literal_run_seconds_saved:.3f}s of search saved" if self.literal_run_seconds_saved else ""))
+        for name, seconds in sorted(self.phase_seconds.items(), key=lambda item: -item[1]):
+            lines.append(f"Phase:      {name:<14} {seconds:.3f}s")
+        if self.match_lengths:
+            lines.append("Match lengths:")
+            largest = max(self.match_lengths.values())
+            for length, count in sorted(self.match_lengths.items()):
+                bar = "#" * max(1, round(40 * count / largest))
+                lines.append(f"  {length:>3} {count:>10} {100 * count / self.pointers:>5.1f}% {bar}")
+        return "\n".join(lines)
@@ -0,0 +1,73 @@
+import os
+import shutil
+import hashlib
+from pathlib import Path
+from LZSS_encoder import ENCODER_VERSION, DEFAULT_PARSER
+
+DEFAULT_CACHE_SIZE = 1024 * 1024 * 1024
+
+
+class CompressionCache:
+    # On-disk cache of CMPS files keyed by a hash of the uncompressed data and of the settings that change the output
+    #
+    # Entries are plain files named after their key. Their modification time is refreshed on every hit and used as the
+    # last use time when trim() evicts the least recently used entries to get back under max_size. Several processes can
+    # share the same directory, entries are renamed into place once complete.
+    def __init__(self, directory, max_size=DEFAULT_CACHE_SIZE):
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def key_for_file(self, path, max_ratio=False, parser=DEFAULT_PARSER, max_chain_length=0, skip_incompressible=False):
+        # The engine is left out on purpose, all of them give the same output for the same settings
+        # The chain length and the skipping only appear when they are used, so the keys of the other settings stay the same
+        settings = (f"{ENCODER_VERSION}:{int(max_ratio)}:{parser}" + (f":{max_chain_length}" if max_chain_length else "")
+                    + (":skip" if skip_incompressible else ""))
+        digest = hashlib.sha256(f"{settings}\n".encode())
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def entry_path(self, key):
+        return self.directory / key[:2] / (key + ".cmps")
+
+    def fetch(self, key, output_file):
+        # Copy the cached CMPS file to output_file, returns False if there is none
+        entry = self.entry_path(key)
+        try:
+            shutil.copyfile(entry, output_file)
+        except FileNotFoundError:
+            self.misses += 1
+            return False
+        os.utime(entry)
+        self.hits += 1
+        return True
+
+    def store(self, key, cmps_file):
+        entry = self.entry_path(key)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        temp_entry = entry.with_name(f"{entry.name}.{os.getpid()}.tmp")
+        shutil.copyfile(cmps_file, temp_entry)
+        os.replace(temp_entry, entry)
+
+    def trim(self):
+        # Evict the least recently used entries until the cache fits in max_size
+        entries = []
+        for path in self.directory.glob("*/*.cmps"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            total_size -= size
+            self.evicted += 1
+        return total_size
@@ -0,0 +1,351 @@
+#! /usr/bin/env python3
+# Round trip and equivalence checks of every encoder/decoder engine, with the time spent in each of them
+#
+# Inputs are random (several kinds of data) or adversarial: matches right around the edges of the window searched by
+# the original encoder (linear addresses 18, 958 and 1023), matches overlapping the bytes being written and inputs
+# ending in the middle of a flag group. For every input:
+#   - the output of each encoder variant must decode back to the input, with every decoder
+#   - variants that must give the same bytes as another one (the indexed engines and the reference one, the compiled
+#     engine and the Python ones, the streaming encoder and the batch one, ...) are compared
+#   - every output must pass lzss_verify(), and random garbage is decoded by every decoder and walked by every verify
+#     engine, which must all agree
+#   - the other format profiles (LZSS) go through the same round trip with the Python, compiled and streaming encoders
+#   - files decompressed or recompressed onto themselves (-o naming the input) keep their content
+#
+#   python fuzz_roundtrip.py --iterations 200 --seed 1
+
+import io
+import os
+import time
+import random
+import argparse
+import tempfile
+from LZSS_encoder import lzss_encode, lzss_reencode, container_encode, encoder_level, LzssEncoder, SEARCH_WINDOW_START, SEARCH_WINDOW_END, DICTIONARY_SIZE, lzss_accel
+from LZSS_decoder import lzss_decode, lzss_verify, container_decode, iter_decode, DECODER_ENGINES, VERIFY_ENGINES
+from helpers import LzssConfig, cmps_lzss_config
+from profiles import PROFILES, CMPS_PROFILE
+from segmented_encoder import lzss_encode_segmented
+from codec_api import decode_lzss_file, encode_lzss_file
+from checkpoint_index import index_path
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DEFAULT_ITERATIONS = 100
+DEFAULT_MAX_SIZE = 16 * 1024
+DEFAULT_MAX_REFERENCE_SIZE = 2048  # The reference encoder runs at about 1 KB/s
+
+
+def stream_encode(data, rng, **options):
+    # LzssEncoder fed with chunks of random sizes
+    encoder = LzssEncoder(**options)
+    encoded = bytearray()
+    pos = 0
+    while pos < len(data):
+        size = rng.choice([1, 7, 19, 64, 1000, 5000])
+        encoded += encoder.feed(data[pos:pos + size])
+        pos += size
+    encoded += encoder.flush()
+    return encoded
+
+
+def reencode(data, rng, engine="hashchain"):
+    # lzss_reencode() from a slightly different previous version of data
+    previous = mutate(data, rng)
+    return lzss_reencode(previous, lzss_encode(previous), data, engine=engine)
+
+
+def segmented_encode(data, rng, **options):
+    # Small segments and overruns so that every input has several of them, including parses that don't meet
+    return lzss_encode_segmented(data, workers=2, segment_size=rng.choice([700, 1500, 4000]), overrun=rng.choice([20, 300]), **options)
+
+
+def mutate(data, rng):
+    data = bytearray(data)
+    kind = rng.randrange(3)
+    if kind == 0 and data:
+        for _ in range(rng.randrange(1, 4)):
+            data[rng.randrange(len(data))] = rng.randrange(256)
+    elif kind == 1:
+        pos = rng.randrange(len(data) + 1)
+        data[pos:pos] = rng.randbytes(rng.randrange(1, 40))
+    elif data:
+        pos = rng.randrange(len(data))
+        del data[pos:pos + rng.randrange(1, 40)]
+    return bytes(data)
+
+
+# (name, encode function, name of the variant it must give the same output as)
+# Variants marked "slow" only run on small inputs
+ENCODER_VARIANTS = [
+    ("reference", lambda data, rng: lzss_encode(data, "reference"), None),
+    ("hashchain", lambda data, rng: lzss_encode(data, "hashchain"), "reference"),
+    ("numpy", lambda data, rng: lzss_encode(data, "numpy"), "reference"),
+    ("c", lambda data, rng: lzss_encode(data, "c"), "hashchain"),
+    ("stream", lambda data, rng: stream_encode(data, rng), "hashchain"),
+    ("reencode", reencode, "hashchain"),
+    ("c-reencode", lambda data, rng: reencode(data, rng, "c"), "hashchain"),
+    ("lazy", lambda data, rng: lzss_encode(data, "hashchain", parser="lazy"), None),
+    ("stream-lazy", lambda data, rng: stream_encode(data, rng, parser="lazy"), "lazy"),
+    ("segmented", segmented_encode, None),
+    ("segmented-strict", lambda data, rng: segmented_encode(data, rng, strict=True), "hashchain"),
+    ("segmented-strict-lazy", lambda data, rng: segmented_encode(data, rng, strict=True, parser="lazy"), "lazy"),
+    ("optimal", lambda data, rng: lzss_encode(data, "hashchain", parser="optimal"), None),
+    ("max-ratio", lambda data, rng: lzss_encode(data, "hashchain", max_ratio=True), None),
+    ("numpy-max-ratio", lambda data, rng: lzss_encode(data, "numpy", max_ratio=True), "max-ratio"),
+    ("c-max-ratio", lambda data, rng: lzss_encode(data, "c", max_ratio=True), "max-ratio"),
+    ("stream-max-ratio", lambda data, rng: stream_encode(data, rng, max_ratio=True), "max-ratio"),
+    ("max-ratio-optimal", lambda data, rng: lzss_encode(data, "hashchain", max_ratio=True, parser="optimal"), None),
+    ("level2", lambda data, rng: lzss_encode(data, "hashchain", **encoder_level(2)), None),
+    ("c-level2", lambda data, rng: lzss_encode(data, "c", **encoder_level(2)), "level2"),
+    ("stream-level2", lambda data, rng: stream_encode(data, rng, **encoder_level(2)), "level2"),
+    ("segmented-strict-level2", lambda data, rng: segmented_encode(data, rng, strict=True, **encoder_level(2)), "level2"),
+    ("skip", lambda data, rng: lzss_encode(data, "hashchain", skip_incompressible=True), None),
+    ("c-skip", lambda data, rng: lzss_encode(data, "c", skip_incompressible=True), "skip"),
+    ("numpy-skip", lambda data, rng: lzss_encode(data, "numpy", skip_incompressible=True), "skip"),
+    ("lazy-skip", lambda data, rng: lzss_encode(data, "hashchain", parser="lazy", skip_incompressible=True), None),
+    ("level1-skip", lambda data, rng: lzss_encode(data, "hashchain", skip_incompressible=True, **encoder_level(1)), None),
+    ("c-level1-skip", lambda data, rng: lzss_encode(data, "c", skip_incompressible=True, **encoder_level(1)), "level1-skip"),
+]
+
+SLOW_VARIANTS = {"reference", "numpy", "numpy-max-ratio", "numpy-skip"}
+
+
+def random_input(rng, max_size):
+    size = rng.randrange(max_size + 1)
+    kind = rng.randrange(5)
+    if kind == 0:
+        return rng.randbytes(size)
+    if kind == 1:
+        return bytes(rng.randrange(4) for _ in range(size))
+    if kind == 2:
+        return bytes(rng.choice(b"\x00\x00\x00\x01\xff") for _ in range(size))
+    if kind == 3:
+        words = [b"Pegasus ", b"Seiya ", b"Athena ", b"\x00", b"\n", b"Cosmo "]
+        return b"".join(rng.choice(words) for _ in range(size // 4))[:size]
+    # Copies of earlier data at random distances, many of them around the dictionary size
+    data = bytearray(rng.randbytes(min(size, 64)))
+    while len(data) < size:
+        distance = rng.randrange(1, min(len(data), DICTIONARY_SIZE + 20) + 1)
+        length = rng.randrange(1, 40)
+        for _ in range(length):
+            data.append(data[-distance])
+        data += rng.randbytes(rng.randrange(3))
+    return bytes(data[:size])
+
+
+def adversarial_inputs(rng):
+    # Yields (name, data)
+
+    # Matches at, just inside and just outside the edges of the window the original encoder searches
+    # Linear address a is DICTIONARY_SIZE - a bytes back
+    edges = [SEARCH_WINDOW_START, 958, SEARCH_WINDOW_END - 1]
+    for address in sorted({a + d for a in edges for d in (-1, 0, 1)}):
+        distance = DICTIONARY_SIZE - address
+        prefix = rng.randbytes(distance + 32)
+        start = len(prefix) - distance
+        yield f"window-edge-{address}", prefix + prefix[start:start + 40] + rng.randbytes(5)
+
+    # Copies that run into the bytes being written, with every short period
+    for period in range(1, 20):
+        yield f"overlap-{period}", rng.randbytes(period) * (60 // period + 2)
+    yield "zeros", bytes(300)
+    yield "zeros-then-data", bytes(20) + rng.randbytes(20) + bytes(30)
+
+    # Inputs ending at every place of a flag group, with pointers and literals
+    for size in range(1, 25):
+        yield f"tail-{size}", bytes(rng.randrange(3) for _ in range(size))
+    yield "empty", b""
+
+
+class Timings:
+    def __init__(self):
+        self.seconds = {}
+        self.sizes = {}
+
+    def run(self, name, size, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+        self.sizes[name] = self.sizes.get(name, 0) + size
+        return result
+
+    def print(self):
+        print(f"{'engine':<24} {'MB':>8} {'seconds':>9} {'MB/s':>8}")
+        for name in sorted(self.seconds):
+            seconds = self.seconds[name]
+            size = self.sizes[name] / 1e6
+            print(f"{name:<24} {size:>8.3f} {seconds:>9.3f} {size / seconds if seconds > 0 else 0:>8.3f}")
+
+
+def available_decoders():
+    return [decoder for decoder in DECODER_ENGINES if decoder != "c" or lzss_accel is not None]
+
+
+def available_verify_engines():
+    return [engine for engine in VERIFY_ENGINES if engine != "c" or lzss_accel is not None]
+
+
+def check_input(name, data, rng, timings, max_reference_size, failures):
+    lzss_config = cmps_lzss_config()
+    outputs = {}
+
+    for variant, encode, same_as in ENCODER_VARIANTS:
+        if variant in SLOW_VARIANTS and len(data) > max_reference_size:
+            continue
+        if variant.startswith("numpy") and numpy is None:
+            continue
+        if variant.startswith("c") and lzss_accel is None:
+            continue
+
+        encoded = bytes(timings.run("encode:" + variant, len(data), encode, data, random.Random(rng.random())))
+        outputs[variant] = encoded
+        if same_as in outputs and encoded != outputs[same_as]:
+            failures.append(f"{name}: {variant} output differs from {same_as}")
+
+        for decoder in available_decoders():
+            if decoder == "reference" and len(data) > max_reference_size:
+                continue
+            decoded = timings.run("decode:" + decoder, len(data), lzss_decode, lzss_config, encoded, decoder)
+            if decoded != data:
+                failures.append(f"{name}: {variant} output doesn't decode back with the {decoder} decoder")
+
+        for engine in available_verify_engines():
+            try:
+                lzss_verify(lzss_config, encoded, len(data), engine)
+            except ValueError as e:
+                failures.append(f"{name}: {variant} output fails the {engine} verify: {e}")
+
+        chunk_size = rng.choice([1, 5, 17, 100, 4096])
+        decoded = timings.run("decode:stream", len(data), lambda: b"".join(iter_decode(io.BytesIO(encoded), lzss_config, chunk_size)))
+        if decoded != data:
+            failures.append(f"{name}: {variant} output doesn't decode back with iter_decode(chunk_size={chunk_size})")
+
+
+def check_profiles(name, data, rng, failures):
+    # Whole files of the profiles other than CMPS, which is covered by check_input()
+    for profile in PROFILES.values():
+        if profile is CMPS_PROFILE:
+            continue
+        for max_ratio in (False, True):
+            variants = {
+                "hashchain": container_encode(data, "hashchain", max_ratio, profile=profile),
+                "lazy": container_encode(data, "hashchain", max_ratio, "lazy", profile=profile),
+                "stream": profile.header(len(data)) + stream_encode(data, rng, max_ratio=max_ratio, profile=profile),
+            }
+            variants["skip"] = container_encode(data, "hashchain", max_ratio, profile=profile, skip_incompressible=True)
+            if lzss_accel is not None:
+                variants["c"] = container_encode(data, "c", max_ratio, profile=profile)
+                variants["c-skip"] = container_encode(data, "c", max_ratio, profile=profile, skip_incompressible=True)
+            for variant, encoded in variants.items():
+                if variant in ("stream", "c") and encoded != variants["hashchain"]:
+                    failures.append(f"{name}: {profile.name} {variant} output differs from hashchain (max_ratio={max_ratio})")
+                if variant == "c-skip" and encoded != variants["skip"]:
+                    failures.append(f"{name}: {profile.name} c-skip output differs from skip (max_ratio={max_ratio})")
+                for decoder in available_decoders():
+                    if container_decode(encoded, decoder) != data:
+                        failures.append(f"{name}: {profile.name} {variant} output doesn't decode back with the {decoder} decoder")
+
+
+def check_in_place(name, data, failures):
+    # The output of the file functions replaces their input only once it is complete
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "file")
+        for decoder in available_decoders():
+            if decoder == "reference":
+                continue
+            with open(path, "wb") as file:
+                file.write(container_encode(data, "hashchain"))
+            decode_lzss_file(path, path, decoder=decoder)
+            with open(path, "rb") as file:
+                if file.read() != data:
+                    failures.append(f"{name}: decompressing in place with the {decoder} decoder loses the content")
+        # The block by block decoder, which saving checkpoints always uses, and no index of the replaced file
+        with open(path, "wb") as file:
+            file.write(container_encode(data, "hashchain"))
+        decode_lzss_file(path, path, save_checkpoints=True)
+        with open(path, "rb") as file:
+            if file.read() != data:
+                failures.append(f"{name}: decompressing in place with checkpoints loses the content")
+        if os.path.exists(index_path(path)):
+            failures.append(f"{name}: decompressing in place saves a checkpoint index of the replaced file")
+        # hashchain streams the input through CmpsWriter, the c engine encodes it from a memory map
+        for engine in ("hashchain", "c") if lzss_accel is not None else ("hashchain",):
+            with open(path, "wb") as file:
+                file.write(data)
+            encode_lzss_file(path, path, engine)
+            with open(path, "rb") as file:
+                if container_decode(file.read()) != data:
+                    failures.append(f"{name}: recompressing in place with the {engine} engine loses the content")
+
+
+def check_garbage(name, data, rng, failures):
+    # Any byte string must decode the same way with every decoder, including the streaming one
+    configs = [cmps_lzss_config(), LzssConfig(), LzssConfig(dictionary_start_position=958, flag_set_is_pointer=False, relative_offset=False)]
+    for lzss_config in configs:
+        expected = lzss_decode(lzss_config, data, "reference")
+        for decoder in available_decoders():
+            if lzss_decode(lzss_config, data, decoder) != expected:
+                failures.append(f"{name}: the {decoder} decoder differs from the reference one")
+        if b"".join(iter_decode(io.BytesIO(data), lzss_config, rng.choice([1, 3, 64]))) != expected:
+            failures.append(f"{name}: iter_decode differs from the reference decoder")
+        # The verify walk must accept the garbage exactly when it decodes to the size given, up to its last byte
+        size = rng.choice([len(expected), rng.randrange(len(expected) + 2)])
+        results = set()
+        for engine in available_verify_engines():
+            try:
+                lzss_verify(lzss_config, data, size, engine)
+                results.add(None)
+            except ValueError as e:
+                results.add(str(e))
+        if len(results) > 1:
+            failures.append(f"{name}: the verify engines disagree")
+        elif None in results and len(expected) != size:
+            failures.append(f"{name}: verify accepts {size} bytes for data decoding to {len(expected)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Round trip and equivalence checks of the LZSS engines")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS, help=f"Number of random inputs. Default: {DEFAULT_ITERATIONS}")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the random inputs, printed at the start when not given")
+    parser.add_argument("--max-size", type=int, default=DEFAULT_MAX_SIZE, help=f"Largest random input. Default: {DEFAULT_MAX_SIZE}")
+    parser.add_argument("--max-reference-size", type=int, default=DEFAULT_MAX_REFERENCE_SIZE, help=f"Largest random input given to the slow engines. Default: {DEFAULT_MAX_REFERENCE_SIZE}")
+    parser.add_argument("--no-adversarial", action="store_true", help="Skip the fixed adversarial inputs, they take a while with the reference encoder")
+    args = parser.parse_args()
+
+    seed = args.seed if args.seed is not None else random.randrange(2**32)
+    print(f"Seed: {seed}")
+    rng = random.Random(seed)
+    timings = Timings()
+    failures = []
+    count = 0
+
+    if not args.no_adversarial:
+        for name, data in adversarial_inputs(rng):
+            # These are the cases the slow engines are here for, they always run
+            check_input(name, data, rng, timings, max(len(data), args.max_reference_size), failures)
+            count += 1
+
+    for iteration in range(args.iterations):
+        data = random_input(rng, args.max_size)
+        check_input(f"random-{iteration} ({len(data)} bytes)", data, rng, timings, args.max_reference_size, failures)
+        check_profiles(f"random-{iteration} ({len(data)} bytes)", data, rng, failures)
+        check_in_place(f"random-{iteration} ({len(data)} bytes)", data, failures)
+        check_garbage(f"garbage-{iteration}", rng.randbytes(rng.randrange(200)), rng, failures)
+        count += 1
+
+    timings.print()
+    for failure in failures:
+        print(f"[FAIL] {failure}")
+    if numpy is None:
+        print("[WARNING] NumPy is not installed, the numpy engine was not checked")
+    if lzss_accel is None:
+        print("[WARNING] The lzss_accel extension is not built, the c engines were not checked")
+    print(f"{count} input(s) checked, {len(failures)} failure(s), seed {seed}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,78 @@
+import os
+import json
+import sqlite3
+import hashlib
+from profiles import PROFILES, MAX_HEADER_SIZE, header_file_type
+
+INDEX_FIELDS = ["path", "magic", "compressed_size", "uncompressed_size", "sha256"]
+SQLITE_EXTENSIONS = (".sqlite", ".sqlite3", ".db")
+
+
+def read_file_info(path, with_hash=False):
+    # Index entry of one file, from its header only unless with_hash also asks for the SHA-256 of the whole file
+    # compressed_size is only set for compressed files (CMPS, LZSS), uncompressed_size comes from their header and is the
+    # file size otherwise
+    size = os.path.getsize(path)
+    digest = None
+    with open(path, "rb") as file:
+        header = file.read(MAX_HEADER_SIZE)
+        if with_hash:
+            digest = hashlib.sha256(header)
+            for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                digest.update(chunk)
+
+    magic = header_file_type(header)
+    if magic in PROFILES:
+        profile = PROFILES[magic]
+        compressed_size = size
+        uncompressed_size = profile.read_header(header) if len(header) >= profile.header_size else None
+    else:
+        compressed_size = None
+        uncompressed_size = size
+
+    return {
+        "path": str(path),
+        "magic": magic,
+        "compressed_size": compressed_size,
+        "uncompressed_size": uncompressed_size,
+        "sha256": digest.hexdigest() if digest is not None else None,
+    }
+
+
+def write_index(entries, index_file):
+    # SQLite database for the .sqlite/.sqlite3/.db extensions, JSON otherwise
+    if str(index_file).lower().endswith(SQLITE_EXTENSIONS):
+        write_sqlite_index(entries, index_file)
+    else:
+        write_json_index(entries, index_file)
+
+
+def write_json_index(entries, index_file):
+    with open(index_file, "w") as f:
+        json.dump({"files": entries}, f, indent=1)
+
+
+def write_sqlite_index(entries, index_file):
+    # Table "files" with one row per file, replaced on every run
+    connection = sqlite3.connect(index_file)
+    try:
+        with connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, magic TEXT, compressed_size INTEGER, "
+                               "uncompressed_size INTEGER, sha256 TEXT)")
+            connection.execute("DELETE FROM files")
+            connection.executemany(f"INSERT OR REPLACE INTO files VALUES ({', '.join('?' * len(INDEX_FIELDS))})",
+                                   [tuple(entry[field] for field in INDEX_FIELDS) for entry in entries])
+    finally:
+        connection.close()
+
+
+def index_summary(entries):
+    # One line totals: how many files of each kind and how much space the compressed ones take once decompressed
+    compressed = [entry for entry in entries if entry["magic"] in PROFILES]
+    fjf = [entry for entry in entries if entry["magic"] == "FJF"]
+    compressed_size = sum(entry["compressed_size"] for entry in compressed)
+    uncompressed_size = sum(entry["uncompressed_size"] or 0 for entry in compressed)
+    profile_counts = [f"{sum(entry['magic'] == name for entry in compressed)} {name}" for name in PROFILES]
+    return (f"{len(entries)} file(s): {len(compressed)} compressed ({', '.join(profile_counts)}; {compressed_size} bytes, "
+            f"{uncompressed_size} bytes decompressed), {len(fjf)} FJF ({sum(entry['uncompressed_size'] for entry in fjf)} bytes), "
+            f"{len(entries) - len(compressed) - len(fjf)} other")
@@ -1,5 +1,10 @@
 # ORIGINAL WORK BY Danijelk, 07/03/2024
 # MODIFIED 6/20/2024: ADDED NOTICE OF ORIGINAL AUTHOR
+import os
+import mmap
+from contextlib import contextmanager
+
+
 class Input_stream:
     def __init__(self, data):
         self.data = data
@@ -22,33 +27,72 @@ class Input_stream:
 
 
 class Dictionary:
+    # Ring buffer of the last dict_size bytes, dict_size being a power of two
+    #
+    # pos is where the next byte goes, which is also the oldest byte: linear address 0 is the oldest byte and
+    # dict_size - 1 the newest. Every byte is stored twice, at i and i + dict_size, so any dict_size bytes from any
+    # position are contiguous in data and can be read with a single slice, without wrapping.
+    __slots__ = ("data", "pos", "size", "mask")
+
     def __init__(self, dict_size, dict_start_position):
-        self.data = bytearray(dict_size)
-        self.pos = dict_start_position
+        if dict_size <= 0 or dict_size & (dict_size - 1):
+            raise ValueError(f"Dictionary size must be a power of two, got {dict_size}")
+        self.data = bytearray(2 * dict_size)
         self.size = dict_size
+        self.mask = dict_size - 1
+        self.pos = dict_start_position & self.mask
 
     def add_byte(self, byte):
-        self.data[self.pos] = byte
-        self.pos = (self.pos + 1) % len(self.data)
+        pos = self.pos
+        self.data[pos] = self.data[pos + self.size] = byte
+        self.pos = (pos + 1) & self.mask
+
+    def extend(self, chunk):
+        # Add all of chunk, of which only the last dict_size bytes stay
+        size = self.size
+        length = len(chunk)
+        if length > size:
+            self.pos = (self.pos + length - size) & self.mask
+            chunk = chunk[length - size:]
+            length = size
+        pos = self.pos
+        data = self.data
+        first = min(length, size - pos)
+        data[pos:pos + first] = data[pos + size:pos + size + first] = chunk[:first]
+        if first < length:
+            data[:length - first] = data[size:size + length - first] = chunk[first:]
+        self.pos = (pos + length) & self.mask
+
+    def copy_from(self, index, length):
+        # Append length bytes read from physical index on, the way a byte by byte copy does: when the source reaches
+        # the bytes being written, they repeat. Returns the bytes copied.
+        start = index & self.mask
+        distance = (self.pos - start) & self.mask or self.size  # How far the source is behind the first byte written
+        if distance >= length:
+            chunk = bytes(self.data[start:start + length])
+        else:
+            chunk = (bytes(self.data[start:start + distance]) * (length // distance + 1))[:length]
+        self.extend(chunk)
+        return chunk
+
+    def window_view(self, address, length):
+        # Memoryview of length (at most dict_size) bytes from linear address on
+        start = (self.pos + address) & self.mask
+        return memoryview(self.data)[start:start + length]
 
     def get_byte(self, index):
-        return self.data[index % len(self.data)]
+        return self.data[index & self.mask]
 
     def get_byte_by_linear_addr(self, address):
-        phy_address = self.linear_to_phy_address(address)
-        # print(f"[DICTIONARY DEBUG] get_byte_by_linear_addr() lin_address = {address}, phy_address = {phy_address}")
-        return self.get_byte(phy_address)
+        return self.data[(self.pos + address) & self.mask]
 
     def linear_to_phy_address(self, address):
-        phy_address = (len(self.data) + self.pos + address) % len(self.data)
-        # print(f"[DICTIONARY DEBUG] linear_to_phy_address() lin_address = {address}, phy_address = {phy_address}")
-        return phy_address
+        return (self.pos + address) & self.mask
 
     def print_content(self):
         print("[DICTIONARY CONTENT] ")
-        #print("Dict len: ", len(self.data))
         print(f"{0:04}:  ", end="")
-        for i, byte in enumerate(self.data):
+        for i, byte in enumerate(self.data[:self.size]):
             print(f"{byte:02X} ", end="")
             if (i+1) % 8 == 0: print(" ", end="")
             if (i+1) % (32) == 0:
@@ -83,6 +127,61 @@ class LzssConfig:
         self.relative_offset = relative_offset
 
 
+# CMPS container used by the BIN/TPL files
+#   0-3: "CMPS"
+#   4-7: 0
+#   8-11: Size of the uncompressed data in little endian
+#   12-15: 0
+CMPS_MAGIC = b"CMPS"
+CMPS_HEADER_SIZE = 16
+
+
+FJF_MAGIC = b"FJF\x00"
+
+
+def cmps_header(uncompressed_size):
+    return CMPS_MAGIC + bytes(4) + (uncompressed_size & 0xFFFFFFFF).to_bytes(4, byteorder='little') + bytes(4)
+
+
+def cmps_lzss_config():
+    lzss_config = LzssConfig()
+    lzss_config.dictionary_start_position = -18
+    lzss_config.first_flag_is_lsb = True
+    lzss_config.flag_set_is_pointer = False
+    lzss_config.relative_offset = False
+    lzss_config.offset_bit_size = 12
+    lzss_config.length_bit_size = 4
+    lzss_config.dictionary_size = 4096
+    return lzss_config
+
+
+@contextmanager
+def map_file(path):
+    # Read-only memory map of the whole file, its pages are only read when used and nothing is copied
+    # Every memoryview of it must be released before the block ends, or closing the map fails
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            yield b""  # Empty files can't be mapped
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+
+
+@contextmanager
+def replace_file(path):
+    # Binary file object writing to a temporary file next to path, which replaces path once the block ends without an
+    # error. path can be the input being read (or mapped): it stays intact until the whole output is written.
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "wb") as file:
+            yield file
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
 def set_bit(value, bit_position):
     # Left shift 1 by bit_position to create a bitmask
     bitmask = 1 << bit_position
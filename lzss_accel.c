@@ -0,0 +1,562 @@
+/*
+ * Compiled LZSS decoder and encoder, used by the "c" engines of LZSS_decoder.py and LZSS_encoder.py when built:
+ *
+ *   python setup.py build_ext --inplace
+ *
+ * decode() takes the same parameters as the Python decoders, so it decodes any LzssConfig, and verify() walks the same
+ * streams without decoding them. encode() is the greedy parse of the hashchain engine for the formats
+ * LZSS_encoder.EncoderFormat accepts, and gives the same bytes for the same settings. parse() returns the operations of
+ * that parse over a range of the input instead, for the encoders that pack them themselves.
+ * All of them release the GIL while they work.
+ */
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <stdlib.h>
+#include <string.h>
+#include <stdint.h>
+
+/* Every format written by the encoder has 2 byte pointers to matches of at least 3 bytes */
+#define MIN_MATCH_SIZE 3
+#define MAX_DICTIONARY_SIZE (1 << 15)
+
+/* Hash chains: the newest position of every hash of 3 bytes, and for every position the previous one with the same hash */
+#define HASH_BITS 15
+#define HASH_SIZE (1 << HASH_BITS)
+
+#define FLAG_TABLE_SIZE (256 * 8)
+
+/* Literal runs of the encoder, the LITERAL_RUN_* constants of LZSS_encoder.py */
+#define LITERAL_RUN_SAMPLE_SIZE 128
+#define LITERAL_RUN_MATCH_RATIO 16
+#define LITERAL_RUN_MIN_SIZE 1024
+#define LITERAL_RUN_MAX_SIZE (4 * 1024)
+
+typedef struct {
+    unsigned char *data;
+    Py_ssize_t size;
+    Py_ssize_t capacity;
+} Buffer;
+
+static int buffer_reserve(Buffer *buffer, Py_ssize_t extra)
+{
+    unsigned char *data;
+    Py_ssize_t capacity = buffer->capacity;
+
+    if (buffer->size + extra <= capacity)
+        return 0;
+    while (capacity < buffer->size + extra)
+        capacity = capacity ? 2 * capacity : 64 * 1024;
+    data = realloc(buffer->data, capacity);
+    if (data == NULL)
+        return -1;
+    buffer->data = data;
+    buffer->capacity = capacity;
+    return 0;
+}
+
+static unsigned int hash3(const unsigned char *bytes)
+{
+    unsigned int key = ((unsigned int)bytes[0] << 16) | ((unsigned int)bytes[1] << 8) | bytes[2];
+    return (key * 2654435761u) >> (32 - HASH_BITS);
+}
+
+/*
+ * decode(data, flag_table, dictionary_size, dictionary_start, min_match_size, length_bit_size, offset_bit_size,
+ *        relative_offset, uncompressed_size) -> bytes
+ *
+ * flag_table[8 * flags_byte + i] is non zero when operation i of a group starting with flags_byte is a pointer, as given
+ * by LZSS_decoder.flag_is_pointer(). The stream ends like with the Python decoders: at the first operation that isn't
+ * complete. uncompressed_size is the size from the header (0 when unknown): the output is allocated for it at once, up
+ * to the most data could decode to, and only grows past it for a stream that decodes to more.
+ */
+static PyObject *lzss_accel_decode(PyObject *self, PyObject *args)
+{
+    Py_buffer data, flags;
+    Py_ssize_t dictionary_size, dictionary_start, min_match_size, length_bit_size, offset_bit_size;
+    int relative_offset;
+    Buffer output = {NULL, 0, 0};
+    unsigned char *ring;
+    int failed = 0;
+    Py_ssize_t uncompressed_size;
+    PyObject *result;
+
+    if (!PyArg_ParseTuple(args, "y*y*nnnnnpn", &data, &flags, &dictionary_size, &dictionary_start, &min_match_size,
+                          &length_bit_size, &offset_bit_size, &relative_offset, &uncompressed_size))
+        return NULL;
+    if (flags.len != FLAG_TABLE_SIZE || dictionary_size <= 0 || (dictionary_size & (dictionary_size - 1)) ||
+            length_bit_size < 1 || length_bit_size > 8 || offset_bit_size < 8 || offset_bit_size > 15) {
+        PyBuffer_Release(&data);
+        PyBuffer_Release(&flags);
+        PyErr_SetString(PyExc_ValueError, "Unsupported decoder configuration");
+        return NULL;
+    }
+    /* Every 2 bytes of data give at most one longest match, a header can't make the first allocation larger */
+    Py_ssize_t max_output_size = (data.len / 2 + 1) * ((1 << length_bit_size) - 1 + min_match_size);
+    if (uncompressed_size > 0) {
+        output.capacity = uncompressed_size < max_output_size ? uncompressed_size : max_output_size;
+        output.data = malloc(output.capacity);
+    }
+    ring = calloc(dictionary_size, 1);
+    if (ring == NULL || (uncompressed_size > 0 && output.data == NULL)) {
+        free(ring);
+        free(output.data);
+        PyBuffer_Release(&data);
+        PyBuffer_Release(&flags);
+        return PyErr_NoMemory();
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    const unsigned char *input = data.buf;
+    const unsigned char *flag_table = flags.buf;
+    Py_ssize_t input_size = data.len;
+    Py_ssize_t pos = 0;
+    Py_ssize_t dictionary_mask = dictionary_size - 1;
+    Py_ssize_t ring_pos = dictionary_start & dictionary_mask;
+    unsigned int length_mask = (1u << length_bit_size) - 1;
+    unsigned int offset_byte2_mask = offset_bit_size > 8 ? 0xFF - length_mask : 0;
+    int offset_byte2_shift = (int)offset_bit_size - 8;
+    int stop = 0;
+
+    while (pos < input_size && !stop) {
+        const unsigned char *is_pointer = flag_table + 8 * input[pos++];
+        for (int i = 0; i < 8; i++) {
+            if (is_pointer[i]) {
+                if (pos + 2 > input_size) {
+                    stop = 1;
+                    break;
+                }
+                unsigned int byte1 = input[pos];
+                unsigned int byte2 = input[pos + 1];
+                pos += 2;
+
+                Py_ssize_t length = (byte2 & length_mask) + min_match_size;
+                Py_ssize_t offset = ((byte2 & offset_byte2_mask) << offset_byte2_shift) | byte1;
+                Py_ssize_t source = relative_offset ? ring_pos + dictionary_size - offset - 1 : offset;
+                if (buffer_reserve(&output, length) < 0) {
+                    failed = 1;
+                    stop = 1;
+                    break;
+                }
+                /* Byte by byte: a copy reading the bytes it writes repeats them */
+                for (Py_ssize_t j = 0; j < length; j++) {
+                    unsigned char byte = ring[(source + j) & dictionary_mask];
+                    output.data[output.size++] = byte;
+                    ring[ring_pos] = byte;
+                    ring_pos = (ring_pos + 1) & dictionary_mask;
+                }
+            } else {
+                if (pos >= input_size) {
+                    stop = 1;
+                    break;
+                }
+                if (buffer_reserve(&output, 1) < 0) {
+                    failed = 1;
+                    stop = 1;
+                    break;
+                }
+                output.data[output.size++] = ring[ring_pos] = input[pos++];
+                ring_pos = (ring_pos + 1) & dictionary_mask;
+            }
+        }
+    }
+    Py_END_ALLOW_THREADS
+
+    free(ring);
+    PyBuffer_Release(&data);
+    PyBuffer_Release(&flags);
+    if (failed) {
+        free(output.data);
+        return PyErr_NoMemory();
+    }
+    result = PyBytes_FromStringAndSize((const char *)output.data, output.size);
+    free(output.data);
+    return result;
+}
+
+/*
+ * verify(data, flag_table, min_match_size, length_bit_size, uncompressed_size) -> (decompressed size, position, truncated)
+ *
+ * Follows the operations of data like decode() without writing anything, until uncompressed_size bytes are reached or
+ * the data ends. Returns how many bytes the operations give, where the walk stopped in data and whether it stopped on a
+ * pointer cut by the end of the data.
+ */
+static PyObject *lzss_accel_verify(PyObject *self, PyObject *args)
+{
+    Py_buffer data, flags;
+    Py_ssize_t min_match_size, length_bit_size, uncompressed_size;
+    Py_ssize_t pos = 0, output_size = 0;
+    int truncated = 0;
+
+    if (!PyArg_ParseTuple(args, "y*y*nnn", &data, &flags, &min_match_size, &length_bit_size, &uncompressed_size))
+        return NULL;
+    if (flags.len != FLAG_TABLE_SIZE || length_bit_size < 1 || length_bit_size > 8) {
+        PyBuffer_Release(&data);
+        PyBuffer_Release(&flags);
+        PyErr_SetString(PyExc_ValueError, "Unsupported decoder configuration");
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    const unsigned char *input = data.buf;
+    const unsigned char *flag_table = flags.buf;
+    Py_ssize_t input_size = data.len;
+    unsigned int length_mask = (1u << length_bit_size) - 1;
+    int stop = 0;
+
+    while (pos < input_size && output_size < uncompressed_size && !stop) {
+        const unsigned char *is_pointer = flag_table + 8 * input[pos++];
+        for (int i = 0; i < 8; i++) {
+            if (is_pointer[i]) {
+                if (pos + 2 > input_size) {
+                    truncated = pos < input_size;
+                    stop = 1;
+                    break;
+                }
+                output_size += (input[pos + 1] & length_mask) + min_match_size;
+                pos += 2;
+            } else {
+                if (pos >= input_size) {
+                    stop = 1;
+                    break;
+                }
+                output_size++;
+                pos++;
+            }
+            if (output_size >= uncompressed_size) {
+                stop = 1;
+                break;
+            }
+        }
+    }
+    Py_END_ALLOW_THREADS
+
+    PyBuffer_Release(&data);
+    PyBuffer_Release(&flags);
+    return Py_BuildValue("nnO", output_size, pos, truncated ? Py_True : Py_False);
+}
+
+/* Hash chain search of the encoders, over the history of the initial (zeroed) dictionary followed by the input: linear
+   dictionary address "addr" at input position "input_pos" is history position input_pos + addr */
+typedef struct {
+    unsigned char *history;
+    Py_ssize_t history_size;
+    Py_ssize_t dictionary_size;
+    Py_ssize_t window_start;
+    Py_ssize_t window_end;
+    Py_ssize_t max_chain_length;
+    Py_ssize_t *head;
+    Py_ssize_t *prev;
+    Py_ssize_t chain_mask;
+    Py_ssize_t next_insert;
+} MatchFinder;
+
+static int match_finder_init(MatchFinder *finder, Py_buffer *data, Py_ssize_t start, Py_ssize_t window_start, Py_ssize_t window_end,
+                             Py_ssize_t dictionary_size, Py_ssize_t max_match_size, Py_ssize_t max_chain_length)
+{
+    /* The bytes of data before start are only history, as after HashChainMatchFinder.skip_to(start) */
+    /* Larger than the distance between the newest and the oldest position searched */
+    Py_ssize_t chain_size = 2 * dictionary_size;
+    while (chain_size <= dictionary_size + max_match_size)
+        chain_size *= 2;
+
+    finder->history_size = dictionary_size + data->len;
+    finder->dictionary_size = dictionary_size;
+    finder->window_start = window_start;
+    finder->window_end = window_end;
+    finder->max_chain_length = max_chain_length;
+    finder->chain_mask = chain_size - 1;
+    finder->next_insert = start + window_start;
+    finder->history = malloc(finder->history_size);
+    finder->head = malloc(HASH_SIZE * sizeof(Py_ssize_t));
+    finder->prev = malloc(chain_size * sizeof(Py_ssize_t));
+    if (finder->history == NULL || finder->head == NULL || finder->prev == NULL)
+        return -1;
+    memset(finder->history, 0, dictionary_size);
+    memcpy(finder->history + dictionary_size, data->buf, data->len);
+    for (Py_ssize_t i = 0; i < HASH_SIZE; i++)
+        finder->head[i] = -1;
+    return 0;
+}
+
+static void match_finder_free(MatchFinder *finder)
+{
+    free(finder->history);
+    free(finder->head);
+    free(finder->prev);
+}
+
+static Py_ssize_t find_match(MatchFinder *finder, Py_ssize_t input_pos, Py_ssize_t max_len, Py_ssize_t *best_pos)
+{
+    /* Length of the longest match at input_pos (0 if none) and its history position in best_pos, the newest on ties */
+    const unsigned char *history = finder->history;
+    Py_ssize_t *head = finder->head;
+    Py_ssize_t *prev = finder->prev;
+    Py_ssize_t chain_mask = finder->chain_mask;
+    Py_ssize_t best_len = 0;
+
+    if (max_len < MIN_MATCH_SIZE)
+        return 0;
+
+    const unsigned char *target = history + finder->dictionary_size + input_pos;
+    Py_ssize_t lowest = input_pos + finder->window_start;
+    Py_ssize_t end = input_pos + finder->window_end - 1;
+    if (end > finder->history_size - MIN_MATCH_SIZE)
+        end = finder->history_size - MIN_MATCH_SIZE;
+
+    /* Index every position that entered the window */
+    for (; finder->next_insert <= end; finder->next_insert++) {
+        unsigned int hash = hash3(history + finder->next_insert);
+        prev[finder->next_insert & chain_mask] = head[hash];
+        head[hash] = finder->next_insert;
+    }
+
+    /* Newest first, positions of other prefixes with the same hash are neither matches nor counted candidates */
+    Py_ssize_t chain_left = finder->max_chain_length ? finder->max_chain_length : PY_SSIZE_T_MAX;
+    for (Py_ssize_t candidate = head[hash3(target)]; candidate >= lowest; candidate = prev[candidate & chain_mask]) {
+        const unsigned char *match = history + candidate;
+        if (match[0] != target[0] || match[1] != target[1] || match[2] != target[2])
+            continue;
+        chain_left--;
+        if (match[best_len] == target[best_len]) {
+            Py_ssize_t length = MIN_MATCH_SIZE;
+            while (length < max_len && match[length] == target[length])
+                length++;
+            if (length > best_len) {
+                best_len = length;
+                *best_pos = candidate;
+                if (length == max_len)
+                    break;
+            }
+        }
+        if (chain_left == 0)
+            break;
+    }
+    return best_len;
+}
+
+static int check_search(Py_ssize_t window_start, Py_ssize_t window_end, Py_ssize_t dictionary_size, Py_ssize_t max_chain_length)
+{
+    if (max_chain_length < 0 || dictionary_size < 256 || dictionary_size > MAX_DICTIONARY_SIZE || (dictionary_size & (dictionary_size - 1))) {
+        PyErr_SetString(PyExc_ValueError, "Unsupported encoder configuration");
+        return -1;
+    }
+    if (window_start < 0 || window_end > dictionary_size || window_start >= window_end) {
+        PyErr_SetString(PyExc_ValueError, "The search window must be within the dictionary");
+        return -1;
+    }
+    return 0;
+}
+
+/*
+ * encode(data, window_start, window_end, dictionary_size, dictionary_start, max_match_size, length_bit_size,
+ *        relative_offset, literal_flag_set, max_chain_length, skip_incompressible, start) -> (bytearray, literal_run_size)
+ *
+ * Greedy encoding of data[start:], the matches being searched at the linear dictionary addresses
+ * [window_start, window_end). The history is the zeroed initial dictionary followed by the input, so address a at input
+ * position t is history position t + a, and data[:start] is only history. Like HashChainMatchFinder the longest match
+ * wins, the newest one on ties, and only the newest max_chain_length candidates starting with the same 3 bytes are
+ * tried (all of them for 0). skip_incompressible writes the blocks following one that hardly matched as literal runs
+ * without searching them, like LZSS_encoder.pack_with_literal_runs(); literal_run_size is how many bytes they hold.
+ */
+static PyObject *lzss_accel_encode(PyObject *self, PyObject *args)
+{
+    Py_buffer data;
+    Py_ssize_t window_start, window_end, dictionary_size, dictionary_start, max_match_size, length_bit_size, max_chain_length, start;
+    int relative_offset, literal_flag_set, skip_incompressible;
+    MatchFinder finder;
+    unsigned char *output = NULL;
+    Py_ssize_t output_size = 0, literal_run_size = 0;
+    PyObject *result;
+
+    if (!PyArg_ParseTuple(args, "y*nnnnnnppnpn", &data, &window_start, &window_end, &dictionary_size, &dictionary_start,
+                          &max_match_size, &length_bit_size, &relative_offset, &literal_flag_set, &max_chain_length,
+                          &skip_incompressible, &start))
+        return NULL;
+    if (check_search(window_start, window_end, dictionary_size, max_chain_length) < 0) {
+        PyBuffer_Release(&data);
+        return NULL;
+    }
+    if (length_bit_size < 1 || length_bit_size > 8 || dictionary_size << length_bit_size != 1 << 16 ||
+            max_match_size < MIN_MATCH_SIZE || max_match_size > (1 << length_bit_size) + MIN_MATCH_SIZE - 1) {
+        PyBuffer_Release(&data);
+        PyErr_SetString(PyExc_ValueError, "Unsupported encoder configuration");
+        return NULL;
+    }
+    if (start < 0 || start > data.len) {
+        PyBuffer_Release(&data);
+        PyErr_SetString(PyExc_ValueError, "The start must be within the input");
+        return NULL;
+    }
+
+    Py_ssize_t input_size = data.len;
+    Py_ssize_t dictionary_mask = dictionary_size - 1;
+    /* A group of 8 literals takes 9 bytes, 8 pointers cover at least 24 bytes in 17 */
+    output = malloc(input_size - start + (input_size - start) / 8 + 2);
+    if (match_finder_init(&finder, &data, start, window_start, window_end, dictionary_size, max_match_size, max_chain_length) < 0 || output == NULL) {
+        match_finder_free(&finder);
+        free(output);
+        PyBuffer_Release(&data);
+        return PyErr_NoMemory();
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    const unsigned char *history = finder.history;
+    Py_ssize_t input_pos = start;
+    Py_ssize_t flags_pos = 0;
+    int flag_cnt = 0;
+    Py_ssize_t block_start = start, block_end = start + LITERAL_RUN_SAMPLE_SIZE, block_matched = 0;
+    Py_ssize_t run_size = LITERAL_RUN_MIN_SIZE;
+
+    while (input_pos < input_size) {
+        if (skip_incompressible && input_pos >= block_end) {
+            /* End of a sampled block, one that hardly matched is followed by literals written without searching */
+            if (block_matched * LITERAL_RUN_MATCH_RATIO < input_pos - block_start) {
+                Py_ssize_t run_end = input_size - input_pos < run_size ? input_size : input_pos + run_size;
+                literal_run_size += run_end - input_pos;
+                for (; input_pos < run_end; input_pos++) {
+                    if (flag_cnt == 0) {
+                        flags_pos = output_size++;
+                        output[flags_pos] = 0;
+                    }
+                    if (literal_flag_set)
+                        output[flags_pos] |= 1 << flag_cnt;
+                    output[output_size++] = history[dictionary_size + input_pos];
+                    flag_cnt = (flag_cnt + 1) & 7;
+                }
+                if (finder.next_insert < run_end + window_start)
+                    finder.next_insert = run_end + window_start;
+                run_size = 2 * run_size < LITERAL_RUN_MAX_SIZE ? 2 * run_size : LITERAL_RUN_MAX_SIZE;
+            } else {
+                run_size = LITERAL_RUN_MIN_SIZE;
+            }
+            block_start = input_pos;
+            block_end = input_pos + LITERAL_RUN_SAMPLE_SIZE;
+            block_matched = 0;
+            continue;
+        }
+
+        Py_ssize_t max_len = input_size - input_pos < max_match_size ? input_size - input_pos : max_match_size;
+        Py_ssize_t best_pos = 0;
+        Py_ssize_t best_len = find_match(&finder, input_pos, max_len, &best_pos);
+
+        if (flag_cnt == 0) {
+            flags_pos = output_size++;
+            output[flags_pos] = 0;
+        }
+        if (best_len) {
+            /* Ring position of history byte best_pos, the ring head starting at dictionary_start, or its distance back
+               from the byte about to be written */
+            Py_ssize_t match_pos;
+            if (relative_offset)
+                match_pos = (dictionary_size - 1 - (best_pos - input_pos)) & dictionary_mask;
+            else
+                match_pos = (best_pos + dictionary_size + dictionary_start) & dictionary_mask;
+            if (!literal_flag_set)
+                output[flags_pos] |= 1 << flag_cnt;
+            output[output_size++] = match_pos & 0xFF;
+            output[output_size++] = ((match_pos >> 8) << length_bit_size) | (best_len - MIN_MATCH_SIZE);
+            input_pos += best_len;
+            block_matched += best_len;
+        } else {
+            if (literal_flag_set)
+                output[flags_pos] |= 1 << flag_cnt;
+            output[output_size++] = history[dictionary_size + input_pos];
+            input_pos++;
+        }
+        flag_cnt = (flag_cnt + 1) & 7;
+    }
+    Py_END_ALLOW_THREADS
+
+    PyBuffer_Release(&data);
+    result = PyByteArray_FromStringAndSize((const char *)output, output_size);
+    if (result != NULL)
+        result = Py_BuildValue("Nn", result, literal_run_size);
+    match_finder_free(&finder);
+    free(output);
+    return result;
+}
+
+/*
+ * parse(data, start, stop, window_start, window_end, dictionary_size, max_match_size, max_chain_length)
+ *       -> (lengths, addrs)
+ *
+ * The greedy parse of encode() for the operations starting from start up to stop, without packing them: the match_len
+ * of every operation (0 for a literal) as bytes and its match_addr as uint16 bytes, like LZSS_encoder.parse_greedy().
+ */
+static PyObject *lzss_accel_parse(PyObject *self, PyObject *args)
+{
+    Py_buffer data;
+    Py_ssize_t start, stop, window_start, window_end, dictionary_size, max_match_size, max_chain_length;
+    MatchFinder finder;
+    unsigned char *lengths = NULL;
+    uint16_t *addrs = NULL;
+    Py_ssize_t count = 0;
+    PyObject *result;
+
+    if (!PyArg_ParseTuple(args, "y*nnnnnnn", &data, &start, &stop, &window_start, &window_end, &dictionary_size, &max_match_size,
+                          &max_chain_length))
+        return NULL;
+    if (check_search(window_start, window_end, dictionary_size, max_chain_length) < 0) {
+        PyBuffer_Release(&data);
+        return NULL;
+    }
+    if (max_match_size < MIN_MATCH_SIZE || max_match_size > 255) {
+        PyBuffer_Release(&data);
+        PyErr_SetString(PyExc_ValueError, "Unsupported encoder configuration");
+        return NULL;
+    }
+    if (start < 0 || stop < start || stop > data.len) {
+        PyBuffer_Release(&data);
+        PyErr_SetString(PyExc_ValueError, "The parsed range must be within the input");
+        return NULL;
+    }
+
+    lengths = malloc(stop - start + 1);
+    addrs = malloc((stop - start + 1) * sizeof(uint16_t));
+    if (match_finder_init(&finder, &data, start, window_start, window_end, dictionary_size, max_match_size, max_chain_length) < 0 ||
+            lengths == NULL || addrs == NULL) {
+        match_finder_free(&finder);
+        free(lengths);
+        free(addrs);
+        PyBuffer_Release(&data);
+        return PyErr_NoMemory();
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    Py_ssize_t input_size = data.len;
+    Py_ssize_t input_pos = start;
+    while (input_pos < stop) {
+        Py_ssize_t max_len = input_size - input_pos < max_match_size ? input_size - input_pos : max_match_size;
+        Py_ssize_t best_pos = 0;
+        Py_ssize_t best_len = find_match(&finder, input_pos, max_len, &best_pos);
+        lengths[count] = (unsigned char)best_len;
+        addrs[count] = best_len ? (uint16_t)(best_pos - input_pos) : 0;
+        count++;
+        input_pos += best_len ? best_len : 1;
+    }
+    Py_END_ALLOW_THREADS
+
+    PyBuffer_Release(&data);
+    result = Py_BuildValue("y#y#", (const char *)lengths, count, (const char *)addrs, count * (Py_ssize_t)sizeof(uint16_t));
+    match_finder_free(&finder);
+    free(lengths);
+    free(addrs);
+    return result;
+}
+
+static PyMethodDef lzss_accel_methods[] = {
+    {"decode", lzss_accel_decode, METH_VARARGS, "Decode LZSS data with the given parameters."},
+    {"verify", lzss_accel_verify, METH_VARARGS, "Walk LZSS data without decoding it, returns its decompressed size."},
+    {"encode", lzss_accel_encode, METH_VARARGS, "Greedy LZSS encoding searching the given dictionary window, returns the output and the size of its literal runs."},
+    {"parse", lzss_accel_parse, METH_VARARGS, "Greedy parse of a range of the input, returns the match lengths and the uint16 match addresses."},
+    {NULL, NULL, 0, NULL}
+};
+
+static struct PyModuleDef lzss_accel_module = {
+    PyModuleDef_HEAD_INIT, "lzss_accel", "Compiled LZSS decoder and encoder", -1, lzss_accel_methods
+};
+
+PyMODINIT_FUNC PyInit_lzss_accel(void)
+{
+    return PyModule_Create(&lzss_accel_module);
+}
@@ -0,0 +1,81 @@
+from helpers import LzssConfig, CMPS_MAGIC, CMPS_HEADER_SIZE, FJF_MAGIC, cmps_lzss_config
+
+
+class FormatProfile:
+    # A compressed container: a header with a magic and the uncompressed size, followed by LZSS data written with fixed
+    # parameters. Both the encoder and the decoders take their settings from it.
+    #
+    # search_window is the range of linear dictionary addresses the encoder looks for matches in, the max ratio mode
+    # always searches the whole dictionary. The lzss_config of a profile is shared and must not be modified.
+    def __init__(self, name, magic, header_size, size_offset, size_byteorder, lzss_config, search_window):
+        self.name = name
+        self.magic = magic
+        self.header_size = header_size
+        self.size_offset = size_offset
+        self.size_byteorder = size_byteorder
+        self.lzss_config = lzss_config
+        self.search_window = search_window
+
+    def matches(self, data):
+        return bytes(data[:len(self.magic)]) == self.magic
+
+    def header(self, uncompressed_size):
+        header = bytearray(self.header_size)
+        header[:len(self.magic)] = self.magic
+        header[self.size_offset:self.size_offset + 4] = (uncompressed_size & 0xFFFFFFFF).to_bytes(4, byteorder=self.size_byteorder)
+        return bytes(header)
+
+    def read_header(self, data):
+        # Returns the uncompressed size stored in the header at the start of data
+        if len(data) < self.header_size or not self.matches(data):
+            raise ValueError(f"Not a {self.name} stream")
+        return int.from_bytes(data[self.size_offset:self.size_offset + 4], byteorder=self.size_byteorder)
+
+
+# CMPS container of the BIN/TPL files, see cmps_header(). The original encoder only searched linear addresses 18 to 1023
+# of its 4096 byte dictionary, which is what keeps repacked files identical to the shipped ones.
+CMPS_PROFILE = FormatProfile("CMPS", CMPS_MAGIC, CMPS_HEADER_SIZE, 8, "little", cmps_lzss_config(), (18, 1024))
+
+# Container of the original LZSS tools
+#   0-3: "LZSS"
+#   4-7: Size of the uncompressed data in big endian
+LZSS_PROFILE = FormatProfile("LZSS", b"LZSS", 8, 4, "big",
+                             LzssConfig(dictionary_start_position=958, flag_set_is_pointer=False, relative_offset=False), (0, 1024))
+
+PROFILES = {profile.name: profile for profile in (CMPS_PROFILE, LZSS_PROFILE)}
+
+# Every magic fits in MIN_HEADER_SIZE bytes, every header in MAX_HEADER_SIZE
+MIN_HEADER_SIZE = min(profile.header_size for profile in PROFILES.values())
+MAX_HEADER_SIZE = max(profile.header_size for profile in PROFILES.values())
+
+
+def get_profile(name):
+    if name not in PROFILES:
+        raise ValueError(f"Unknown format profile '{name}', expected one of: {', '.join(PROFILES)}")
+    return PROFILES[name]
+
+
+def detect_profile(header):
+    # Profile of the container starting with header, or None
+    for profile in PROFILES.values():
+        if profile.matches(header):
+            return profile
+    return None
+
+
+def container_profile(header):
+    # detect_profile() for data that has to be a compressed file
+    profile = detect_profile(header)
+    if profile is None:
+        raise ValueError("Not a compressed stream of a known format")
+    return profile
+
+
+def header_file_type(header):
+    # The profile name of a compressed file ("CMPS", "LZSS"), "FJF" for an uncompressed one or None from its first bytes
+    profile = detect_profile(header)
+    if profile is not None:
+        return profile.name
+    if bytes(header[:4]) == FJF_MAGIC:
+        return "FJF"
+    return None
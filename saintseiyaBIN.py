@@ -1,78 +1,251 @@
-import struct
+import sys
+import time
+import pstats
+import cProfile
+import asyncio
 import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from struct import unpack
-from LZSS_decoder import *
-from LZSS_encoder import *
-from helpers import LzssConfig
-
-def ru32(buf, offset):
-    return struct.unpack("<I", buf[offset:offset+4])[0]
-
-def wu32(value):
-    return struct.pack("<I", value)
-
-def decode_lzss_file(input_file, output_file):
-    # Read the input file
-    with open(input_file, "rb") as f:
-        input_data = f.read()
-
-    # Skip the first 16 bytes
-    input_data = input_data[16:]
-
-    lzss_config = LzssConfig()
-    lzss_config.dictionary_start_position = -18
-    lzss_config.first_flag_is_lsb = True
-    lzss_config.flag_set_is_pointer = False
-    lzss_config.relative_offset = False
-    lzss_config.offset_bit_size = 12
-    lzss_config.length_bit_size = 4
-    lzss_config.dictionary_size = 4096
-
-    # Call lzss_decode with the input data
-    decompressed_data = lzss_decode(lzss_config, input_data)
-
-    # Write the output to the output file
-    with open(output_file, "wb") as f:
-        f.write(decompressed_data)
-    return 0
+from LZSS_decoder import DEFAULT_DECODER_ENGINE, lzss_accel
+from LZSS_encoder import (
+    ENCODER_ENGINES, ENCODER_LEVELS, MATCH_FINDERS, PARSERS, STREAMING_PARSERS, DEFAULT_ENCODER_ENGINE, DEFAULT_PARSER,
+)
+from profiles import PROFILES
+from compression_cache import CompressionCache, DEFAULT_CACHE_SIZE
+from codec_stats import CodecStats
+from header_index import read_file_info, write_index, index_summary
+from checkpoint_index import build_checkpoint_index, index_path
+from batch_pipeline import run_pipeline, DEFAULT_PIPELINE_MEMORY
+from stream_verify import verify_file
+from codec_api import (
+    decode_lzss_file, encode_lzss_file, encode_lzss_file_cached, reencode_lzss_file, detect_file_type, is_glob_pattern,
+    collect_input_files, collect_batch_files, iter_batch_results,
+)
+
+PROFILE_TOP_FUNCTIONS = 25
+
+def print_cache_summary(cache):
+    lookups = cache.hits + cache.misses
+    hit_rate = 100 * cache.hits / lookups if lookups else 0
+    print(f"Cache: {cache.hits} hit(s), {cache.misses} miss(es) ({hit_rate:.1f}% hits), {cache.evicted} entry(ies) evicted")
+
+def run_batch(jobs, workers=None, engine=DEFAULT_ENCODER_ENGINE, max_ratio=False, parser=DEFAULT_PARSER, cache=None, collect_stats=False, save_checkpoints=False, in_process=False,
+              pipeline_memory=None, decoder=DEFAULT_DECODER_ENGINE, max_chain_length=0, skip_incompressible=False):
+    # Process the (input file, output file) pairs on a pool of worker processes, returns the number of failed files
+    # pipeline_memory reads and writes the files in batch_pipeline.run_pipeline() instead, with up to that many bytes
+    # of files in memory, which can't be combined with the cache, checkpoints or in_process
+    counts = {}
+    total_input = 0
+    total_stats = CodecStats()
+    start = time.perf_counter()
+
+    def report(inpath, outpath, result):
+        nonlocal total_input
+        status, input_size, output_size, seconds, message, cache_hit, stats = result
+        counts[status] = counts.get(status, 0) + 1
+        if stats is not None:
+            total_stats.merge(CodecStats.from_dict(stats))
+        if cache_hit is not None:
+            if cache_hit:
+                cache.hits += 1
+            else:
+                cache.misses += 1
+        total_input += input_size
+        if message:
+            print(f"[{status}] {inpath}: {message}")
+        else:
+            rate = input_size / seconds / 1e6 if seconds > 0 else 0
+            print(f"[{status}] {inpath} -> {outpath} ({input_size} -> {output_size} bytes, {rate:.2f} MB/s)")
+
+    if pipeline_memory is not None:
+        asyncio.run(run_pipeline(jobs, (engine, max_ratio, parser, collect_stats, decoder, max_chain_length, skip_incompressible), report, workers, pipeline_memory))
+    else:
+        for inpath, outpath, result in iter_batch_results(jobs, workers, in_process, engine=engine, max_ratio=max_ratio, parser=parser, cache=cache,
+                                                          collect_stats=collect_stats, save_checkpoints=save_checkpoints, decoder=decoder,
+                                                          max_chain_length=max_chain_length, skip_incompressible=skip_incompressible):
+            report(inpath, outpath, result)
+
+    elapsed = time.perf_counter() - start
+    rate = total_input / elapsed / 1e6 if elapsed > 0 else 0
+    print(f"Processed {len(jobs)} file(s) in {elapsed:.2f}s ({total_input} bytes, {rate:.2f} MB/s): " +
+          ", ".join(f"{count} {status}" for status, count in sorted(counts.items())))
+    if cache is not None:
+        cache.trim()
+        print_cache_summary(cache)
+    if collect_stats:
+        print(total_stats.report())
+    return counts.get("error", 0)
+
+def print_profile(profiler):
+    print(f"Top {PROFILE_TOP_FUNCTIONS} functions by cumulative time:")
+    pstats.Stats(profiler).strip_dirs().sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+
+def info_main(argv):
+    # "info"/"ls" subcommand: list files from their headers only, nothing is decompressed
+    parser = argparse.ArgumentParser(prog="saintseiyaBIN.py info", description="List BIN/TPL files and their sizes from their headers only.")
+    parser.add_argument("inpath", nargs="+", help="Files, directories (searched recursively) or glob patterns.")
+    parser.add_argument("--index", type=str, default="", help="Optional. Save the list to this file: SQLite for .sqlite/.sqlite3/.db, JSON otherwise.")
+    parser.add_argument("--hash", action="store_true", help="Optional. Add the SHA-256 of every file, which reads them entirely.")
+    args = parser.parse_args(argv)
+
+    entries = [read_file_info(path, args.hash) for path, _ in collect_input_files(args.inpath)]
+    print(f"{'type':<5} {'compressed':>12} {'uncompressed':>12}  path")
+    for entry in entries:
+        compressed = entry["compressed_size"] if entry["compressed_size"] is not None else "-"
+        uncompressed = entry["uncompressed_size"] if entry["uncompressed_size"] is not None else "?"
+        print(f"{entry['magic'] or '-':<5} {compressed:>12} {uncompressed:>12}  {entry['path']}" +
+              (f"  {entry['sha256']}" if entry["sha256"] else ""))
+    print(index_summary(entries))
 
-def encode_lzss_file(input_file, output_file):
-    # Read the input file
-    with open(input_file, "rb") as file:
-        input_data = file.read()
-
-    # Compress the data
-    print("This operation may take a long time. Please wait...")
-    encoded_data = lzss_encode(input_data)
-
-    # Write the output to the output file
-    # In first 16 bytes it writes:
-    #   0-3: "CMPS"
-    #   4-7: 0
-    #   8-11: Size of compressed data in little endian
-    #   12-15: 0
-    # The rest of the file is the compressed data
-    with open(output_file, "wb") as file:
-        file.write(b"CMPS")
-        file.write(wu32(0))
-        size = len(input_data) & 0xFFFFFFFF
-
-        file.write(size.to_bytes(4, byteorder='little'))
-        file.write(wu32(0))
-        file.write(encoded_data)
+    if args.index:
+        write_index(entries, args.index)
+        print(f"Index saved to {args.index}")
     return 0
 
-parser = argparse.ArgumentParser(description='SS BIN Decompression/Compression') # I was bored
-parser.add_argument("inpath", help="File Input (BIN/TPL)")
-parser.add_argument("-o", "--outpath", type=str, default="", help="Optional. The name used for the output folder or file.")
+def verify_main(argv):
+    # "verify" subcommand: check the structure of compressed files without decompressing them, on all CPU cores
+    parser = argparse.ArgumentParser(prog="saintseiyaBIN.py verify", description="Check that compressed files are complete and end exactly at the size of their header, without decompressing them.")
+    parser.add_argument("inpath", nargs="+", help="Files, directories (searched recursively) or glob patterns.")
+    parser.add_argument("--crc", action="store_true", help="Optional. Also decompress every file to print the CRC32 of its content.")
+    parser.add_argument("--source", type=str, default="", help="Optional. Folder of the uncompressed originals, laid out like the inputs. The CRC32 of every file's content must match its original.")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Optional. Number of worker processes. Defaults to the number of CPUs.")
+    parser.add_argument("--codec", type=str, default="auto", choices=["auto", "c", "python"], help="Optional. Use the compiled lzss_accel extension (c), the pure Python code (python) or the extension when it is built (auto, default).")
+    args = parser.parse_args(argv)
+    if args.codec == "c" and lzss_accel is None:
+        parser.error("The C codec needs the lzss_accel extension, build it with: python setup.py build_ext --inplace")
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers must be at least 1")
+    engine = "c" if args.codec != "python" and lzss_accel is not None else "python"
 
-args = parser.parse_args()
+    jobs = []
+    for path, base in collect_input_files(args.inpath):
+        source = str(Path(args.source) / path.relative_to(base)) if args.source else None
+        jobs.append((str(path), source))
 
-if Path(args.inpath).is_file() and not Path(args.inpath).is_dir():
-    with open(args.inpath, "rb") as input_file:
-        input_buffer = bytearray( input_file.read() )
+    counts = {}
+    total_size = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(verify_file, path, args.crc, source, engine): path for path, source in jobs}
+        for future in as_completed(futures):
+            path = futures[future]
+            status, uncompressed_size, crc, seconds, message = future.result()
+            counts[status] = counts.get(status, 0) + 1
+            total_size += uncompressed_size
+            if message:
+                print(f"[{status}] {path}: {message}")
+            else:
+                print(f"[{status}] {path} ({uncompressed_size} bytes" + (f", CRC32 {crc:08x})" if crc is not None else ")"))
+
+    elapsed = time.perf_counter() - start
+    rate = total_size / elapsed / 1e6 if elapsed > 0 else 0
+    print(f"Verified {len(jobs)} file(s) in {elapsed:.2f}s ({total_size} bytes of content, {rate:.2f} MB/s): " +
+          ", ".join(f"{count} {status}" for status, count in sorted(counts.items())))
+    return 1 if counts.get("invalid") or counts.get("error") else 0
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] in ("info", "ls"):
+        return info_main(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == "verify":
+        return verify_main(sys.argv[2:])
+
+    parser = argparse.ArgumentParser(description='SS BIN Decompression/Compression', epilog="Use 'info' or 'ls' as the first argument to list files from their headers, see 'info --help', or 'verify' to check compressed files, see 'verify --help'.") # I was bored
+    parser.add_argument("inpath", nargs="+", help="File Input (BIN/TPL). Several files, directories or glob patterns process everything they contain.")
+    parser.add_argument("-o", "--outpath", type=str, default="", help="Optional. The name used for the output folder or file.")
+    parser.add_argument("-e", "--engine", type=str, default=None, choices=list(ENCODER_ENGINES), help="Optional. The match search used when recompressing. Defaults to c when the extension is built (see --codec), hashchain otherwise or with --segmented. numpy is experimental and several times slower than hashchain.")
+    parser.add_argument("--codec", type=str, default="auto", choices=["auto", "c", "python"], help="Optional. Use the compiled lzss_accel extension (c), the pure Python engines (python) or the extension when it is built (auto, default). Build it with: python setup.py build_ext --inplace")
+    parser.add_argument("--max-ratio", action="store_true", help="Optional. Search the whole dictionary when recompressing. Smaller files, but not identical to the originals.")
+    parser.add_argument("-p", "--parser", type=str, default=None, choices=list(PARSERS), help=f"Optional. How matches are chosen when recompressing ({DEFAULT_PARSER} by default). Anything but greedy gives smaller files that are not identical to the originals.")
+    parser.add_argument("--level", type=int, default=None, choices=list(ENCODER_LEVELS), help="Optional. Compression level from 1 (fastest) to 6 (smallest), which sets the search and the parser. Levels give files that are not identical to the originals.")
+    parser.add_argument("--skip-incompressible", action="store_true", help="Optional. Write the parts of a file that hardly compress (random or already compressed data) as literals without searching them. Much faster on such data, the files can be a little larger.")
+    parser.add_argument("--cache", type=str, default="", help="Optional. Folder used to cache recompressed files, unchanged files are then copied from it instead of compressed again.")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE // (1024 * 1024), help="Optional. Size limit of the cache folder in MiB, the least recently used files are removed past it.")
+    parser.add_argument("--previous", nargs=2, metavar=("OLD_INPUT", "OLD_OUTPUT"), help="Optional. An earlier version of the file and its recompressed output, made with the same settings. Only what changed since is compressed again, with the C search when -e c is used.")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Optional. Number of worker processes used for several files. Defaults to the number of CPUs.")
+    parser.add_argument("--segmented", action="store_true", help="Optional. Recompress a single large file in segments on --workers processes. The output can differ from a serial run where the segments don't line up, unless --strict is given. Uses the Python hashchain search, a serial run with the C extension is faster.")
+    parser.add_argument("--strict", action="store_true", help="Optional. With --segmented, always produce the same output as a serial run.")
+    parser.add_argument("--stats", action="store_true", help="Optional. Print the literal/pointer counts, match length histogram, candidates scanned per position and time per phase.")
+    parser.add_argument("--checkpoints", action="store_true", help="Optional. Save a checkpoint index (.cpi) next to every compressed file read or written, which lets checkpoint_index.read_range() decompress any part of it without starting over.")
+    parser.add_argument("--profile", action="store_true", help="Optional. Run under cProfile and print the functions the time went to. Several files are then processed one at a time.")
+    parser.add_argument("--pipeline", action="store_true", help="Optional. For several files, read and write them in the background while the worker processes only compress or decompress, which keeps the CPUs busy on slow (network) drives.")
+    parser.add_argument("--pipeline-memory", type=int, default=DEFAULT_PIPELINE_MEMORY // (1024 * 1024), help="Optional. With --pipeline, how many MiB of files can be held in memory between being read and written.")
+
+    args = parser.parse_args()
+    if args.engine == "c" and args.codec == "python":
+        parser.error("-e c can't be combined with --codec python")
+    if lzss_accel is None and (args.codec == "c" or args.engine == "c"):
+        parser.error("The C codec needs the lzss_accel extension, build it with: python setup.py build_ext --inplace")
+    use_c = args.codec != "python" and lzss_accel is not None
+    if args.engine is None:
+        args.engine = "c" if use_c and not args.segmented else "hashchain"
+    args.decoder = "c" if use_c else "fast"
+    if args.level is not None and (args.max_ratio or args.parser is not None):
+        parser.error("--level sets the search and the parser, it can't be combined with --max-ratio or --parser")
+    if args.level is not None:
+        args.max_ratio, args.parser, args.max_chain_length = ENCODER_LEVELS[args.level]
+    else:
+        args.parser = args.parser or DEFAULT_PARSER
+        args.max_chain_length = 0
+    if args.max_chain_length and args.engine not in ("hashchain", "c"):
+        parser.error(f"--level {args.level} needs the hashchain or c engine")
+    if args.max_chain_length and args.previous:
+        parser.error(f"--level {args.level} can't be combined with --previous, it needs a level trying every candidate")
+    if args.skip_incompressible and (args.engine == "reference" or args.parser not in STREAMING_PARSERS):
+        parser.error("--skip-incompressible needs an indexed engine and one of the parsers: " + ", ".join(STREAMING_PARSERS))
+    if args.skip_incompressible and (args.segmented or args.previous):
+        parser.error("--skip-incompressible can't be combined with --segmented or --previous")
+    if args.max_ratio and args.engine == "reference":
+        parser.error("--max-ratio needs an indexed engine: " + ", ".join(MATCH_FINDERS))
+    if args.parser != DEFAULT_PARSER and args.engine == "reference":
+        parser.error(f"--parser {args.parser} needs an indexed engine: " + ", ".join(MATCH_FINDERS))
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.previous and args.parser not in STREAMING_PARSERS:
+        parser.error("--previous needs one of the parsers: " + ", ".join(STREAMING_PARSERS))
+    if args.previous and args.engine not in ("hashchain", "c"):
+        parser.error("--previous needs the hashchain or c engine")
+    if args.segmented and args.engine == "c":
+        parser.error("--segmented runs the Python hashchain search in parallel, a serial run with -e c is faster")
+    if args.segmented and (args.engine != "hashchain" or args.parser not in STREAMING_PARSERS):
+        parser.error("--segmented needs the hashchain engine and one of the parsers: " + ", ".join(STREAMING_PARSERS))
+    if args.strict and not args.segmented:
+        parser.error("--strict only applies to --segmented")
+    if args.segmented and args.previous:
+        parser.error("--segmented can't be combined with --previous")
+    if args.segmented and args.cache and not args.strict:
+        parser.error("--segmented needs --strict to use the cache, the cached files are those of a serial run")
+    if args.pipeline and (args.cache or args.checkpoints or args.profile):
+        parser.error("--pipeline can't be combined with --cache, --checkpoints or --profile")
+    if args.pipeline_memory < 1:
+        parser.error("--pipeline-memory must be at least 1")
+
+    if not args.profile:
+        return run(parser, args)
 
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        return run(parser, args)
+    finally:
+        profiler.disable()
+        print_profile(profiler)
+
+def run(parser, args):
+    cache = CompressionCache(args.cache, args.cache_size * 1024 * 1024) if len(args.cache) > 0 else None
+    stats = CodecStats() if args.stats else None
+
+    if len(args.inpath) > 1 or is_glob_pattern(args.inpath[0]) or Path(args.inpath[0]).is_dir():
+        if args.previous:
+            parser.error("--previous only works on a single file")
+        if args.segmented:
+            parser.error("--segmented only works on a single file, several files are already spread over the workers")
+        jobs = collect_batch_files(args.inpath, args.outpath if len(args.outpath) > 0 else "output")
+        pipeline_memory = args.pipeline_memory * 1024 * 1024 if args.pipeline else None
+        return 1 if run_batch(jobs, args.workers, args.engine, args.max_ratio, args.parser, cache, args.stats, args.checkpoints, args.profile, pipeline_memory, args.decoder,
+                              args.max_chain_length, args.skip_incompressible) else 0
+
+    inpath = args.inpath[0]
+    if Path(inpath).is_file() and not Path(inpath).is_dir():
         outpath = "./"
         if len(args.outpath) > 0: # Outpath takes priority!!
             outpath += args.outpath
@@ -83,15 +256,37 @@ if Path(args.inpath).is_file() and not Path(args.inpath).is_dir():
             output_folder = outpath.rsplit("/",1)[0]+"/" # Split output into folder and filename
             output_file = outpath.rsplit("/",1)[1]
             Path(output_folder).mkdir(parents=True,exist_ok=True)
-        if (ru32(input_buffer, 0) == 0x53504D43):
-            un = decode_lzss_file(args.inpath, outpath)
+        file_type = detect_file_type(inpath)
+        if file_type in PROFILES:
+            un = decode_lzss_file(inpath, outpath, stats, args.checkpoints, args.decoder)
             if un == 0:
                 print(f"Successfully decompressed to {outpath}")
         else:
-            if (ru32(input_buffer, 0) == 0x464A46):
-                re = encode_lzss_file(args.inpath, outpath)
-                if re == 0:
-                    print(f"Successfully recompressed to {outpath}")
+            if file_type == "FJF":
+                if args.previous:
+                    re = reencode_lzss_file(inpath, outpath, args.previous[0], args.previous[1], args.max_ratio, args.parser, stats, args.engine)
+                    if re == 0:
+                        print(f"Successfully recompressed to {outpath}")
+                elif cache is not None:
+                    if encode_lzss_file_cached(inpath, outpath, cache, args.engine, args.max_ratio, args.parser, stats, args.segmented, args.strict, args.workers, args.max_chain_length,
+                                               args.skip_incompressible):
+                        print(f"Successfully copied the cached recompressed file to {outpath}")
+                    else:
+                        print(f"Successfully recompressed to {outpath}")
+                    cache.trim()
+                else:
+                    print("This operation may take a long time. Please wait...")
+                    re = encode_lzss_file(inpath, outpath, args.engine, args.max_ratio, args.parser, stats, args.segmented, args.strict, args.workers, args.max_chain_length,
+                                          args.skip_incompressible)
+                    if re == 0:
+                        print(f"Successfully recompressed to {outpath}")
+                if args.checkpoints:
+                    build_checkpoint_index(outpath).save(index_path(outpath))
             else:
                 print("This file is not compressed.")
-        input_file.close()
+        if stats is not None and (stats.literals or stats.pointers or stats.phase_seconds):
+            print(stats.report())
+    return 0
+
+if __name__ == '__main__':
+    exit(main())
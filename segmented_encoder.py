@@ -0,0 +1,156 @@
+import os
+from array import array
+from bisect import bisect_left
+from itertools import accumulate
+from concurrent.futures import ProcessPoolExecutor
+from LZSS_encoder import (
+    HashChainMatchFinder, OperationPacker, PARSERS, STREAMING_PARSERS, DEFAULT_PARSER, DICTIONARY_SIZE, MIN_MATCH_SIZE,
+    MAX_MATCH_SIZE, FULL_WINDOW_START, FULL_WINDOW_END, lzss_encode,
+)
+
+MIN_SEGMENT_SIZE = 256 * 1024
+DEFAULT_OVERRUN = 64 * 1024
+
+# Input bytes covered by an operation of each match_len, a literal being 0
+OPERATION_SIZES = bytes([1]) + bytes(range(1, 256))
+
+
+# ABOUT SEGMENTED ENCODING
+#
+# The greedy and lazy parsers choose the operation at an input position from that position and the input alone (the
+# dictionary is always the DICTIONARY_SIZE input bytes before it), so a parse started anywhere becomes the serial parse
+# as soon as one of its operations starts where one of the serial parse does. Every segment of the input is parsed by
+# a worker process from its start, with the DICTIONARY_SIZE bytes before it as history, and carries on up to overrun
+# bytes into the next segment. The parse of segment k is the serial one, so the first of its operations in the overrun
+# that starts where an operation of segment k+1 does is where the parse of segment k+1 is the serial one too: the
+# operations are stitched there and packed into flag groups in order.
+#
+# If the parses don't meet within the overrun (runs of a period that doesn't divide the segment distance can do that),
+# the last operation before the next segment is cut short at its start, which gives a valid stream that may differ from
+# the serial one. In strict mode the parse goes on serially instead until it meets one of the next segments.
+#
+# The workers run the Python hashchain search. Stitching and packing the operations is serial Python work too, so once
+# lzss_accel is built a serial lzss_encode() with the c engine is faster than any number of workers.
+
+
+class SegmentParse:
+    def __init__(self, start, lengths, addrs):
+        self.start = start
+        self.lengths = lengths
+        self.addrs = array("H", addrs)
+        # positions[i] is where operation i starts, positions[-1] where the last one ends
+        self.positions = list(accumulate(lengths.translate(OPERATION_SIZES), initial=start))
+        self.position_set = None
+
+    def starts_at(self, pos):
+        if self.position_set is None:
+            self.position_set = set(self.positions[:-1])
+        return pos in self.position_set
+
+
+def match_finder_from(data, max_ratio, max_chain_length=0):
+    if max_ratio:
+        return HashChainMatchFinder(data, FULL_WINDOW_START, FULL_WINDOW_END, max_chain_length)
+    return HashChainMatchFinder(data, max_chain_length=max_chain_length)
+
+
+def parse_segment(data, base, start, stop, max_ratio=False, parser=DEFAULT_PARSER, max_chain_length=0):
+    # Runs in a worker process. data is the input from position base on, with at least the DICTIONARY_SIZE bytes before
+    # start and a full look-ahead buffer after stop. Returns the match_len of the operations starting from start up to
+    # stop as bytes and their match_addr as array("H") bytes.
+    match_finder = match_finder_from(data, max_ratio, max_chain_length)
+    match_finder.skip_to(start - base)
+    lengths = bytearray()
+    addrs = array("H")
+    for match_len, match_addr in PARSERS[parser](match_finder, len(data), start - base, stop - base):
+        lengths.append(match_len)
+        addrs.append(match_addr)
+    return bytes(lengths), addrs.tobytes()
+
+
+def lzss_encode_segmented(raw_input, max_ratio=False, parser=DEFAULT_PARSER, workers=None, segment_size=None, strict=False,
+                          overrun=DEFAULT_OVERRUN, max_chain_length=0):
+    # lzss_encode() with the match search of every segment of the input done in parallel, see above
+    # The output is the same as lzss_encode() whenever the parses meet in every overrun, and always with strict
+    if parser not in STREAMING_PARSERS:
+        raise ValueError(f"Parser '{parser}' can't encode segments, expected one of: {', '.join(STREAMING_PARSERS)}")
+
+    input_size = len(raw_input)
+    workers = workers or os.cpu_count() or 1
+    if segment_size is None:
+        segment_size = max(MIN_SEGMENT_SIZE, -(-input_size // workers))
+    # Segment k+1 must start its parse before the overrun of segment k ends, for the search of the meeting point
+    overrun = max(1, min(overrun, segment_size // 2))
+    starts = list(range(0, input_size, segment_size))
+    if len(starts) < 2:
+        return lzss_encode(raw_input, max_ratio=max_ratio, parser=parser, max_chain_length=max_chain_length)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = []
+        for index, start in enumerate(starts):
+            stop = min(input_size, start + segment_size + overrun) if index + 1 < len(starts) else input_size
+            base = max(0, start - DICTIONARY_SIZE)
+            data = bytes(raw_input[base:min(input_size, stop + MAX_MATCH_SIZE + 1)])
+            futures.append(executor.submit(parse_segment, data, base, start, stop, max_ratio, parser, max_chain_length))
+        segments = [SegmentParse(start, *future.result()) for start, future in zip(starts, futures)]
+
+    encoded_output = bytearray()
+    packer = OperationPacker()
+
+    def pack(segment, first, last):
+        packer.pack(zip(segment.lengths[first:last], segment.addrs[first:last]), raw_input, encoded_output)
+
+    pos = 0  # Where the next operation starts
+    index = 0
+    while index < len(segments):
+        segment = segments[index]
+        first = bisect_left(segment.positions, pos)
+        if index + 1 == len(segments):
+            pack(segment, first, len(segment.lengths))
+            break
+
+        following = segments[index + 1]
+        boundary = bisect_left(segment.positions, following.start, first)
+        meeting = next((i for i in range(boundary, len(segment.lengths)) if following.starts_at(segment.positions[i])), None)
+        if meeting is not None:
+            pack(segment, first, meeting)
+            pos = segment.positions[meeting]
+            index += 1
+        elif not strict:
+            # Cut the operation running into the next segment, a shorter match is still a match
+            pack(segment, first, boundary - 1)
+            last_pos = segment.positions[boundary - 1]
+            last_len = following.start - last_pos
+            if segment.lengths[boundary - 1] and last_len >= MIN_MATCH_SIZE:
+                packer.pack([(last_len, segment.addrs[boundary - 1])], raw_input, encoded_output)
+            else:
+                packer.pack([(0, 0)] * last_len, raw_input, encoded_output)
+            pos = following.start
+            index += 1
+        else:
+            pack(segment, first, len(segment.lengths))
+            pos, index = parse_until_meeting(raw_input, segment.positions[-1], segments, index + 1, max_ratio, parser, packer, encoded_output,
+                                             max_chain_length)
+
+    packer.flush(encoded_output)
+    return encoded_output
+
+
+def parse_until_meeting(raw_input, pos, segments, index, max_ratio, parser, packer, encoded_output, max_chain_length=0):
+    # Serial parse from pos, which is where an operation of the serial parse starts, until one of the operations starts
+    # where one of segments[index:] does. Returns that position and the index of the segment, or the end of the input.
+    input_size = len(raw_input)
+    base = max(0, pos - DICTIONARY_SIZE)
+    match_finder = match_finder_from(raw_input[base:], max_ratio, max_chain_length)
+    match_finder.skip_to(pos - base)
+    parse = PARSERS[parser]
+
+    while pos < input_size:
+        while index + 1 < len(segments) and segments[index + 1].start <= pos:
+            index += 1
+        if segments[index].starts_at(pos):
+            return pos, index
+        # Operations don't depend on where the input starts, only the packer needs the real input positions
+        packer.pack(parse(match_finder, input_size - base, pos - base, pos - base + 1), raw_input, encoded_output)
+        pos = packer.input_pos
+    return pos, len(segments)
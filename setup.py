@@ -0,0 +1,12 @@
+# Builds the optional lzss_accel extension next to the scripts, the "c" engines are used once it is there:
+#
+#   python setup.py build_ext --inplace
+#
+# Without it everything runs on the pure Python engines.
+
+from setuptools import setup, Extension
+
+setup(
+    name="saintseiyaBIN",
+    ext_modules=[Extension("lzss_accel", ["lzss_accel.c"])],
+)
@@ -0,0 +1,59 @@
+import time
+import zlib
+from LZSS_decoder import container_verify, container_decode, ContainerReader, DEFAULT_CHUNK_SIZE, DEFAULT_VERIFY_ENGINE, MAX_WHOLE_DECODE_SIZE
+from helpers import map_file
+from profiles import detect_profile, container_profile
+
+
+# ABOUT VERIFYING
+#
+# A full decode doesn't tell a damaged file from a good one: the decoders stop quietly at the first operation that isn't
+# complete. container_verify() walks the flags and the pointer lengths only, which is enough to check that the
+# operations end exactly at the uncompressed size of the header and at the end of the file, without writing any output.
+# The CRC32 of the content is optional since it needs the real decode.
+
+
+def file_crc32(path):
+    crc = 0
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def content_crc32(data, engine=DEFAULT_VERIFY_ENGINE):
+    # CRC32 of the decompressed content of a compressed file. The compiled decoder decodes it at once up to
+    # MAX_WHOLE_DECODE_SIZE, the Python one and larger files are decoded block by block so only one block is held at a time.
+    if engine == "c" and container_profile(data).read_header(data) <= MAX_WHOLE_DECODE_SIZE:
+        return zlib.crc32(container_decode(data, "c"))
+    crc = 0
+    with ContainerReader(data) as reader:
+        for chunk in iter(lambda: reader.read(DEFAULT_CHUNK_SIZE), b""):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def verify_file(path, with_crc=False, source=None, engine=DEFAULT_VERIFY_ENGINE):
+    # Runs in a worker process. Returns (status, uncompressed size, CRC32 or None, seconds, message), status being "ok",
+    # "invalid" (the message says why), "skipped" for files that aren't compressed or "error" when a file can't be read
+    # source is the uncompressed original of path, whose CRC32 the content must have. with_crc only reports the CRC32.
+    start = time.perf_counter()
+    uncompressed_size = 0
+    crc = None
+    try:
+        with map_file(path) as data:
+            if detect_profile(data) is None:
+                return "skipped", 0, None, time.perf_counter() - start, "This file is not compressed."
+            try:
+                uncompressed_size = container_verify(data, engine)
+            except ValueError as e:
+                return "invalid", uncompressed_size, None, time.perf_counter() - start, str(e)
+            if with_crc or source is not None:
+                crc = content_crc32(data, engine)
+        if source is not None:
+            expected = file_crc32(source)
+            if crc != expected:
+                return "invalid", uncompressed_size, crc, time.perf_counter() - start, f"CRC32 {crc:08x} differs from {expected:08x} of {source}"
+        return "ok", uncompressed_size, crc, time.perf_counter() - start, ""
+    except OSError as e:
+        return "error", uncompressed_size, crc, time.perf_counter() - start, f"{type(e).__name__}: {e}"